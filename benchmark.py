@@ -0,0 +1,366 @@
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+import carga_datos
+import geometrias
+from cubo import sumar_por
+from datos_sinteticos import generar_csv, generar_limites, generar_poblacion, generar_unidades
+from figuras import (figura_edad, figura_evolucion, figura_factores, figura_riesgo, figura_sexo,
+                     figura_top_geos)
+from filtros import crear_motor
+from mapa import casos_por_feature, centros_mapa_calor, construir_mapa, construir_mapa_calor, tamaño_html
+from metricas import NIVELES, calcular_metricas, completar_filtro, predicados
+from poblacion import cargar_tabla_poblacion
+from pronostico import entrenar, pronostico_vista
+from union_geo import indice_union
+
+DIR_BENCHMARK = '.benchmark'
+TOLERANCIA_REGRESION = 0.2
+
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return {'mediana': statistics.median(tiempos), 'minimo': min(tiempos), 'repeticiones': repeticiones}
+
+
+def preparar_datos(filas, directorio=DIR_BENCHMARK, semilla=0):
+    # Los datos dependen solo de (filas, semilla), así los resultados de distintos commits son comparables.
+    ruta = os.path.join(directorio, f'datos_{filas}_{semilla}.csv')
+    dir_limites = os.path.join(directorio, f'limites_{semilla}')
+    ruta_poblacion = os.path.join(directorio, f'poblacion_{semilla}.csv')
+    os.makedirs(directorio, exist_ok=True)
+    if not os.path.exists(ruta):
+        generar_csv(ruta, filas, semilla=semilla)
+    if not os.path.exists(dir_limites):
+        generar_limites(generar_unidades(semilla), dir_limites, semilla)
+    if not os.path.exists(ruta_poblacion):
+        generar_poblacion(generar_unidades(semilla), semilla=semilla).to_csv(ruta_poblacion, index=False)
+    return ruta, dir_limites, ruta_poblacion
+
+
+def filtros_representativos(cubo):
+    año = int(cubo['ano'].max())
+    deptos = sumar_por(cubo, 'departamento').nlargest(3, 'casos')['departamento'].astype(str).tolist()
+    return {
+        'todo': {},
+        'año': {'año': año},
+        'departamentos': {'año': año, 'nivel': 'Provincia', 'departamentos': deptos},
+        'distrito': {'año': año, 'nivel': 'Distrito', 'departamentos': deptos,
+                     'sexo': 'F', 'tipo_edad': 'ADULTOS', 'semanas': (5, 20)},
+    }
+
+
+def ejecutar(filas, repeticiones=5, repeticiones_carga=1, directorio=DIR_BENCHMARK, semilla=0,
+             interacciones=False, sesiones=0):
+    ruta, dir_limites, ruta_poblacion = preparar_datos(filas, directorio, semilla)
+    dir_cache = os.path.join(directorio, f'cache_{filas}_{semilla}')
+    dir_nuevos = os.path.join(directorio, 'sin_nuevos')
+    geometrias.DIR_GEOJSON = dir_limites
+    etapas = {}
+
+    def carga_completa():
+        shutil.rmtree(dir_cache, ignore_errors=True)
+        carga_datos.actualizar_cache(ruta, dir_cache, dir_nuevos)
+
+    etapas['carga_csv'] = medir(carga_completa, repeticiones_carga)
+    etapas['carga_cache'] = medir(lambda: carga_datos.cargar_cubo(ruta, dir_cache, dir_nuevos), repeticiones)
+    cubo, _ = carga_datos.cargar_cubo(ruta, dir_cache, dir_nuevos)
+    etapas['indices_filtro'] = medir(lambda: crear_motor(cubo), repeticiones)
+    tabla_poblacion = cargar_tabla_poblacion(ruta_poblacion)
+    etapas['union_poblacion'] = medir(lambda: crear_motor(cubo, tabla_poblacion), repeticiones)
+    motor = crear_motor(cubo, tabla_poblacion)
+
+    filtros = filtros_representativos(cubo)
+    deptos = filtros['distrito']['departamentos']
+
+    def opciones_sidebar():
+        sorted(cubo['ano'].unique())
+        int(cubo['semana'].min()), int(cubo['semana'].max())
+        for columna in ('sexo', 'tipo_edad', 'departamento'):
+            cubo[columna].cat.categories.tolist()
+        provincias = motor.jerarquia.provincias(deptos)
+        motor.jerarquia.distritos(provincias[:5])
+
+    etapas['opciones_sidebar'] = medir(opciones_sidebar, repeticiones)
+
+    for nombre, filtro in filtros.items():
+        filtro = completar_filtro(filtro, cubo)
+        etapas[f'filtrado[{nombre}]'] = medir(
+            lambda: cubo.take(motor.seleccionar(*predicados(filtro)).filas), repeticiones)
+
+    cubo_filtrado = cubo.take(motor.seleccionar(*predicados(completar_filtro(filtros['año'], cubo))).filas)
+    for nivel, columna in NIVELES.items():
+        etapas[f'agregacion_geo[{nivel}]'] = medir(lambda: sumar_por(cubo_filtrado, columna), repeticiones)
+
+    for nivel in NIVELES:
+        metricas = calcular_metricas(motor, {**filtros['año'], 'nivel': nivel})
+        etapas[f'topologia[{nivel}]'] = medir(
+            lambda: geometrias.construir_topologia(geometrias.cargar_geojson(nivel, 0.0),
+                                                   geometrias.TOLERANCIA_POR_NIVEL[nivel]), repeticiones_carga)
+        limites = geometrias.cargar_topojson(nivel)
+        indice = indice_union(motor, metricas.geo_column, limites)
+        etapas[f'mapa_html[{nivel}]'] = medir(lambda: tamaño_html(construir_mapa(
+            limites, metricas.casos_geo, indice, geometrias.PROPIEDADES[nivel],
+            nivel, metricas.casos_totales, 'Casos de Dengue')), repeticiones)
+        etapas[f'mapa_incidencia_html[{nivel}]'] = medir(lambda: tamaño_html(construir_mapa(
+            limites, metricas.casos_geo, indice, geometrias.PROPIEDADES[nivel],
+            nivel, metricas.casos_totales, 'Casos de Dengue por 100 mil hab.', medida='incidencia')), repeticiones)
+        geometrias_nivel = limites['objects']['limites']['geometries']
+        etapas[f'mapa_calor_html[{nivel}]'] = medir(lambda: tamaño_html(construir_mapa_calor(
+            centros_mapa_calor(geometrias.centroides(nivel), indice),
+            casos_por_feature(geometrias_nivel, metricas.casos_geo, indice), nivel)), repeticiones)
+
+    metricas = calcular_metricas(motor, filtros['año'])
+    etapas['metricas'] = medir(lambda: calcular_metricas(motor, filtros['año']), repeticiones)
+    # Un proceso: la etapa mide el costo por núcleo, comparable entre máquinas.
+    ruta_pronosticos = os.path.join(dir_cache, 'pronosticos.parquet')
+    etapas['entrenamiento_pronostico'] = medir(
+        lambda: entrenar(motor, procesos=1, ruta=ruta_pronosticos), repeticiones_carga)
+    etapas['pronostico_vista'] = medir(
+        lambda: pronostico_vista(motor, metricas.filtro, ruta_pronosticos), repeticiones)
+    pronostico = pronostico_vista(motor, metricas.filtro, ruta_pronosticos)
+    figuras = {
+        'top_geos': lambda: figura_top_geos(metricas.top_geos, metricas.geo_column, 'Departamento', 'bench'),
+        'top_geos_incidencia': lambda: figura_top_geos(metricas.top_incidencia, metricas.geo_column,
+                                                       'Departamento', 'bench', 'incidencia'),
+        'evolucion': lambda: figura_evolucion(metricas.casos_semana, 'bench', metricas.canal),
+        'evolucion_pronostico': lambda: figura_evolucion(metricas.casos_semana, 'bench', metricas.canal,
+                                                         pronostico),
+        'sexo': lambda: figura_sexo(metricas.casos_sexo),
+        'edad': lambda: figura_edad(metricas.casos_edad),
+        'riesgo': lambda: figura_riesgo(metricas.riesgo, metricas.geo_column),
+        'factores': figura_factores,
+    }
+    for nombre, construir in figuras.items():
+        # Se incluye la serialización porque es lo que guarda el cache de figuras.
+        etapas[f'figura[{nombre}]'] = medir(lambda: _a_json(construir()), repeticiones)
+
+    if interacciones:
+        etapas.update(_en_proceso_aparte(_interacciones, (repeticiones,), ruta, dir_cache, dir_limites,
+                                         ruta_poblacion))
+    memoria = None
+    if sesiones:
+        memoria = _en_proceso_aparte(_sesiones, (sesiones,), ruta, dir_cache, dir_limites, ruta_poblacion)
+
+    return {
+        'commit': commit_actual(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'filas': filas,
+        'semilla': semilla,
+        'celdas': len(cubo),
+        'etapas': etapas,
+        'memoria_sesiones': memoria,
+    }
+
+
+def _interacciones(repeticiones):
+    # Latencia de rerun del dashboard (medida por el propio script) para interacciones típicas.
+    from streamlit.testing.v1 import AppTest
+
+    import perfil
+
+    totales = []
+
+    class Registro(logging.Handler):
+        def emit(self, registro):
+            totales.append(json.loads(registro.getMessage())['total_ms'] / 1000)
+
+    perfil.log.handlers[:] = [Registro()]
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard.py'),
+                            default_timeout=600)
+    app.run()
+
+    def selector(etiqueta):
+        return next(widget for widget in app.sidebar.selectbox if etiqueta in widget.label)
+
+    años = selector('Año').options
+    semanas = app.sidebar.slider[0]
+    minimo, maximo = semanas.min, semanas.max
+    interacciones = {
+        'sin_cambios': lambda i: app.run(),
+        'año': lambda i: selector('Año').select(años[-1 - i % 3]).run(),
+        'nivel': lambda i: selector('Nivel').select(['Provincia', 'Departamento'][i % 2]).run(),
+        'sexo': lambda i: selector('Sexo').select(['F', 'Todos'][i % 2]).run(),
+        'semanas': lambda i: app.sidebar.slider[0].set_value((minimo + i % 3, maximo)).run(),
+    }
+    tiempos = {nombre: [] for nombre in interacciones}
+    for i in range(repeticiones):
+        for nombre, interaccion in interacciones.items():
+            interaccion(i)
+            if app.exception:
+                raise RuntimeError(app.exception[0].message)
+            tiempos[nombre].append(totales[-1])
+    return {f'rerun[{nombre}]': {'mediana': statistics.median(valores), 'minimo': min(valores),
+                                 'repeticiones': repeticiones}
+            for nombre, valores in tiempos.items()}
+
+
+def _sesiones(n_sesiones):
+    # Abre una sesión que carga el dataset y luego n sesiones concurrentes, midiendo con
+    # tracemalloc cuánta memoria retiene cada una. La memoria "de datos" es la asignada desde
+    # los módulos de carga, filtrado y métricas (no la de elementos de interfaz).
+    import gc
+    import threading
+    import tracemalloc
+
+    from streamlit.testing.v1 import AppTest
+
+    from datos_compartidos import datos
+
+    ruta_app = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard.py')
+
+    def abrir_sesion(sesiones, i):
+        app = AppTest.from_file(ruta_app, default_timeout=600)
+        app.run()
+        sesiones[i] = app
+
+    primera = [None]
+    abrir_sesion(primera, 0)
+    gc.collect()
+    tracemalloc.start(64)
+    antes = tracemalloc.take_snapshot()
+
+    sesiones = [None] * n_sesiones
+    hilos = [threading.Thread(target=abrir_sesion, args=(sesiones, i)) for i in range(n_sesiones)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    gc.collect()
+    despues = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    if any(sesion is None or sesion.exception for sesion in sesiones):
+        raise RuntimeError('Una de las sesiones concurrentes falló')
+
+    modulos_datos = ['*/carga_datos.py', '*/cubo.py', '*/filtros.py', '*/metricas.py', '*/datos_compartidos.py']
+    filtro_datos = [tracemalloc.Filter(True, patron, all_frames=True) for patron in modulos_datos]
+
+    def crecimiento(filtros=()):
+        diferencias = despues.filter_traces(filtros).compare_to(antes.filter_traces(filtros), 'filename')
+        return sum(diferencia.size_diff for diferencia in diferencias)
+
+    mb = 1024 ** 2
+    return {
+        'sesiones': n_sesiones,
+        'cargas_dataset': datos.cargas,
+        'dataset_mb': datos.memoria_bytes() / mb,
+        'por_sesion_mb': crecimiento() / n_sesiones / mb,
+        'datos_por_sesion_mb': crecimiento(filtro_datos) / n_sesiones / mb,
+    }
+
+
+def _en_proceso_aparte(funcion, argumentos, ruta, dir_cache, dir_limites, ruta_poblacion):
+    # Las variables de entorno se fijan antes de crear el proceso para que los módulos
+    # las lean al importarse.
+    entorno = {'DENGUEAI_CSV': ruta, 'DENGUEAI_CACHE': dir_cache, 'DENGUEAI_GEOJSON': dir_limites,
+               'DENGUEAI_NUEVOS': os.path.join(os.path.dirname(dir_cache), 'sin_nuevos'),
+               'DENGUEAI_POBLACION': ruta_poblacion,
+               'DENGUEAI_LOG_NIVEL': 'INFO'}
+    anterior = {clave: os.environ.get(clave) for clave in entorno}
+    os.environ.update(entorno)
+    try:
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            return pool.apply(funcion, argumentos)
+    finally:
+        for clave, valor in anterior.items():
+            if valor is None:
+                os.environ.pop(clave, None)
+            else:
+                os.environ[clave] = valor
+
+
+def _a_json(figuras):
+    if isinstance(figuras, list):
+        return [figura.to_json() for figura in figuras]
+    return figuras.to_json()
+
+
+def comparar(actual, base, tolerancia=TOLERANCIA_REGRESION):
+    regresiones = []
+    print(f"{'etapa':<32}{'base (s)':>12}{'actual (s)':>12}{'cambio':>10}")
+    for etapa, medida in actual['etapas'].items():
+        if etapa not in base['etapas']:
+            print(f'{etapa:<32}{"-":>12}{medida["mediana"]:>12.4f}{"nueva":>10}')
+            continue
+        anterior = base['etapas'][etapa]['mediana']
+        cambio = medida['mediana'] / anterior - 1 if anterior > 0 else 0.0
+        marca = '  REGRESIÓN' if cambio > tolerancia else ''
+        print(f'{etapa:<32}{anterior:>12.4f}{medida["mediana"]:>12.4f}{cambio:>+10.1%}{marca}')
+        if marca:
+            regresiones.append(etapa)
+    return regresiones
+
+
+def imprimir(resultado):
+    print(f"commit {resultado['commit']}  filas {resultado['filas']:,}  celdas {resultado['celdas']:,}")
+    for etapa, medida in resultado['etapas'].items():
+        print(f"{etapa:<32}{medida['mediana']:>10.4f} s  (mín. {medida['minimo']:.4f} s, n={medida['repeticiones']})")
+    memoria = resultado['memoria_sesiones']
+    if memoria:
+        print(f"{memoria['sesiones']} sesiones concurrentes: {memoria['cargas_dataset']} carga(s) del dataset "
+              f"({memoria['dataset_mb']:,.1f} MB); por sesión {memoria['por_sesion_mb']:,.2f} MB, "
+              f"de ellos datos {memoria['datos_por_sesion_mb']:,.3f} MB")
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Mide cada etapa del dashboard sobre datos sintéticos')
+    parser.add_argument('--filas', type=int, nargs='+', default=[1_000_000],
+                        help='tamaños a medir, por ejemplo 1000000 10000000 50000000')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--repeticiones-carga', type=int, default=1,
+                        help='repeticiones de las etapas lentas (ingesta del CSV y topología)')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--sesiones', type=int, default=0, metavar='N',
+                        help='abre N sesiones concurrentes y mide la memoria que añade cada una')
+    parser.add_argument('--interacciones', action='store_true',
+                        help='mide también la latencia de rerun del dashboard para interacciones típicas')
+    parser.add_argument('--dir', default=DIR_BENCHMARK)
+    parser.add_argument('--comparar', metavar='RESULTADO_BASE',
+                        help='JSON de un benchmark anterior con el mismo número de filas')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_REGRESION)
+    args = parser.parse_args()
+
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+
+    regresiones = []
+    for filas in args.filas:
+        resultado = ejecutar(filas, args.repeticiones, args.repeticiones_carga, args.dir, args.semilla,
+                             args.interacciones, args.sesiones)
+        imprimir(resultado)
+        ruta = os.path.join(args.dir, 'resultados', f"{resultado['commit']}_{filas}_{args.semilla}.json")
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+        print(f'Resultados guardados en {ruta}')
+
+        if base is not None and base['filas'] == filas:
+            regresiones += comparar(resultado, base, args.tolerancia)
+
+    sys.exit(1 if regresiones else 0)
@@ -0,0 +1,289 @@
+import glob
+import hashlib
+import json
+import os
+import resource
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from cubo import DIMENSIONES, combinar_cubos, concatenar, construir_cubo, sumar_cubos
+
+RUTA_CSV = os.environ.get('DENGUEAI_CSV', 'datos_dengue.csv')
+DIR_CACHE = os.environ.get('DENGUEAI_CACHE', '.cache_dengueai')
+DIR_NUEVOS = os.environ.get('DENGUEAI_NUEVOS', 'nuevas_semanas')
+
+# Se incrementa cuando cambia el formato del cache para forzar su regeneración.
+VERSION_CACHE = 6
+
+# Archivos más grandes que esto se agregan por bloques sin cargarlos completos en memoria.
+UMBRAL_BLOQUES = int(os.environ.get('DENGUEAI_UMBRAL_BLOQUES', 2 * 1024 ** 3))
+FILAS_POR_BLOQUE = 1_000_000
+BLOQUES_POR_COMBINACION = 8
+
+COLUMNAS_CATEGORICAS = ['departamento', 'provincia', 'distrito', 'sexo', 'tipo_edad']
+COLUMNAS_ENTERAS = ['ano', 'semana', 'ubigeo', 'edad']
+
+Actualizacion = namedtuple('Actualizacion', ['tipo', 'filas_nuevas', 'periodos'])
+Bloque = namedtuple('Bloque', ['numero', 'filas', 'segundos', 'filas_por_segundo', 'memoria_max_mb'])
+
+
+def firma_archivo(ruta):
+    info = os.stat(ruta)
+    return {'mtime_ns': info.st_mtime_ns, 'bytes': info.st_size}
+
+
+def archivos_nuevos(dir_nuevos=DIR_NUEVOS):
+    return sorted(glob.glob(os.path.join(dir_nuevos, '*.csv')))
+
+
+def version_fuentes(ruta=RUTA_CSV, dir_nuevos=DIR_NUEVOS):
+    firmas = [(ruta, firma_archivo(ruta))]
+    firmas += [(os.path.basename(nuevo), firma_archivo(nuevo)) for nuevo in archivos_nuevos(dir_nuevos)]
+    return ';'.join(f"{nombre}:{firma['mtime_ns']}:{firma['bytes']}" for nombre, firma in firmas)
+
+
+def hash_archivo(ruta, limite=None, tam_bloque=1 << 20):
+    sha = hashlib.sha256()
+    restante = os.path.getsize(ruta) if limite is None else limite
+    with open(ruta, 'rb') as archivo:
+        while restante > 0:
+            bloque = archivo.read(min(tam_bloque, restante))
+            if not bloque:
+                break
+            sha.update(bloque)
+            restante -= len(bloque)
+    return sha.hexdigest()
+
+
+def rutas_cache(ruta_csv, dir_cache=DIR_CACHE):
+    base = os.path.splitext(os.path.basename(ruta_csv))[0]
+    return {
+        'cubo': os.path.join(dir_cache, f'{base}.cubo.parquet'),
+        'meta': os.path.join(dir_cache, f'{base}.json'),
+    }
+
+
+def _leer_meta(ruta_meta):
+    try:
+        with open(ruta_meta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _escribir_meta(ruta_meta, meta):
+    temporal = f'{ruta_meta}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(meta, archivo)
+    os.replace(temporal, ruta_meta)
+
+
+def _escribir_parquet(df, ruta):
+    temporal = f'{ruta}.tmp'
+    df.to_parquet(temporal, index=False)
+    os.replace(temporal, ruta)
+
+
+def compactar_tipos(df):
+    df = df.copy()
+    for columna in df.columns:
+        if columna in COLUMNAS_CATEGORICAS:
+            # Las categorías quedan ordenadas, así los códigos respetan el orden alfabético.
+            df[columna] = df[columna].astype('category')
+        elif columna in COLUMNAS_ENTERAS and pd.api.types.is_integer_dtype(df[columna]):
+            df[columna] = pd.to_numeric(df[columna], downcast='integer')
+        elif pd.api.types.is_string_dtype(df[columna]) and df[columna].nunique() < len(df) // 2:
+            df[columna] = df[columna].astype('category')
+    return df
+
+
+def leer_csv(ruta=RUTA_CSV):
+    return compactar_tipos(pd.read_csv(ruta))
+
+
+def reporte_memoria(df_original, df_compacto):
+    bytes_original = df_original.memory_usage(deep=True, index=False)
+    bytes_compacto = df_compacto.memory_usage(deep=True, index=False)
+    reporte = pd.DataFrame({
+        'tipo_original': df_original.dtypes.astype(str),
+        'bytes_original': bytes_original,
+        'tipo_compacto': df_compacto.dtypes.astype(str),
+        'bytes_compacto': bytes_compacto,
+    })
+    reporte.loc['TOTAL'] = ['', bytes_original.sum(), '', bytes_compacto.sum()]
+    reporte['reduccion'] = reporte['bytes_original'] / np.maximum(reporte['bytes_compacto'], 1)
+    return reporte
+
+
+def periodos_de(df):
+    pares = df[['ano', 'semana']].drop_duplicates().to_numpy()
+    return sorted((int(ano), int(semana)) for ano, semana in pares)
+
+
+def _memoria_max_mb():
+    # ru_maxrss está en KB en Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def agregar_por_bloques(ruta, filas_por_bloque=FILAS_POR_BLOQUE, al_procesar=None):
+    tipos = {columna: 'category' for columna in DIMENSIONES if columna in COLUMNAS_CATEGORICAS}
+    tipos.update(ano='int16', semana='int8')
+    lector = pd.read_csv(ruta, usecols=DIMENSIONES, dtype=tipos, chunksize=filas_por_bloque)
+
+    parciales = []
+    inicio = time.perf_counter()
+    for numero, bloque in enumerate(lector, start=1):
+        parciales.append(construir_cubo(bloque))
+        # Combinar cada cierto número de bloques mantiene acotada la memoria por el
+        # número de celdas distintas, no por el tamaño del archivo.
+        if len(parciales) > BLOQUES_POR_COMBINACION:
+            parciales = [sumar_cubos(parciales)]
+        if al_procesar is not None:
+            segundos = time.perf_counter() - inicio
+            al_procesar(Bloque(numero, len(bloque), segundos, len(bloque) / max(segundos, 1e-9), _memoria_max_mb()))
+        inicio = time.perf_counter()
+
+    cubo = sumar_cubos(parciales)
+    # read_csv crea las categorías en orden de aparición; se ordenan como en compactar_tipos.
+    for columna in tipos:
+        if tipos[columna] == 'category':
+            cubo[columna] = cubo[columna].cat.reorder_categories(sorted(cubo[columna].cat.categories))
+    return cubo
+
+
+def _reconstruir(ruta, rutas, firma, nuevos, por_bloques=None, al_procesar=None):
+    # Versiones anteriores del cache guardaban también los registros individuales.
+    base = rutas['cubo'][:-len('.cubo.parquet')]
+    for viejo in glob.glob(f'{glob.escape(base)}.parquet') + glob.glob(f'{glob.escape(base)}.delta-*.parquet'):
+        os.remove(viejo)
+    if por_bloques is None:
+        por_bloques = firma['bytes'] > UMBRAL_BLOQUES
+
+    if por_bloques:
+        cubo = sumar_cubos([agregar_por_bloques(fuente, al_procesar=al_procesar) for fuente in [ruta] + nuevos])
+        columnas = pd.read_csv(ruta, nrows=0).columns.tolist()
+    else:
+        df = concatenar([leer_csv(ruta)] + [leer_csv(nuevo) for nuevo in nuevos])
+        cubo = construir_cubo(df)
+        columnas = df.columns.tolist()
+
+    _escribir_parquet(cubo, rutas['cubo'])
+    _escribir_meta(rutas['meta'], {
+        'version': VERSION_CACHE,
+        **firma,
+        'sha256': hash_archivo(ruta),
+        'columnas': columnas,
+        'por_bloques': por_bloques,
+        'incorporados': {os.path.basename(nuevo): firma_archivo(nuevo) for nuevo in nuevos},
+    })
+    return Actualizacion('completa', int(cubo['casos'].sum()), periodos_de(cubo))
+
+
+def _filas_agregadas(ruta, meta, firma):
+    # Devuelve las filas añadidas al final del CSV desde la última ingesta, o None
+    # si el archivo cambió de otra forma y hay que reconstruir el cache.
+    if firma['bytes'] <= meta['bytes']:
+        return None
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(meta['bytes'] - 1)
+        if archivo.read(1) != b'\n':
+            return None
+    if hash_archivo(ruta, limite=meta['bytes']) != meta['sha256']:
+        return None
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(meta['bytes'])
+        return pd.read_csv(archivo, header=None, names=meta['columnas'])
+
+
+def actualizar_cache(ruta=RUTA_CSV, dir_cache=DIR_CACHE, dir_nuevos=DIR_NUEVOS, por_bloques=None, al_procesar=None):
+    os.makedirs(dir_cache, exist_ok=True)
+    rutas = rutas_cache(ruta, dir_cache)
+    firma = firma_archivo(ruta)
+    nuevos = archivos_nuevos(dir_nuevos)
+    meta = _leer_meta(rutas['meta'])
+
+    def reconstruir():
+        return _reconstruir(ruta, rutas, firma, nuevos, por_bloques, al_procesar)
+
+    if (meta is None or meta.get('version') != VERSION_CACHE or not os.path.exists(rutas['cubo'])
+            or por_bloques not in (None, meta['por_bloques'])):
+        return reconstruir()
+
+    deltas = []
+    if (meta['mtime_ns'], meta['bytes']) != (firma['mtime_ns'], firma['bytes']):
+        # El mtime cambió (copia, checkout, touch): solo hay trabajo si cambió el contenido.
+        if meta['bytes'] == firma['bytes'] and hash_archivo(ruta) == meta['sha256']:
+            meta.update(firma)
+        else:
+            agregadas = _filas_agregadas(ruta, meta, firma)
+            if agregadas is None:
+                return reconstruir()
+            deltas.append(agregadas)
+            meta.update(firma, sha256=hash_archivo(ruta))
+
+    for nuevo in nuevos:
+        nombre = os.path.basename(nuevo)
+        firma_nuevo = firma_archivo(nuevo)
+        if nombre in meta['incorporados']:
+            if meta['incorporados'][nombre] != firma_nuevo:
+                # Un archivo semanal ya incorporado fue reemplazado.
+                return reconstruir()
+            continue
+        deltas.append(pd.read_csv(nuevo))
+        meta['incorporados'][nombre] = firma_nuevo
+
+    if not deltas:
+        _escribir_meta(rutas['meta'], meta)
+        return Actualizacion('sin_cambios', 0, [])
+
+    delta = compactar_tipos(concatenar(deltas))
+    _escribir_parquet(combinar_cubos(pd.read_parquet(rutas['cubo']), construir_cubo(delta)), rutas['cubo'])
+    _escribir_meta(rutas['meta'], meta)
+    return Actualizacion('incremental', len(delta), periodos_de(delta))
+
+
+def cargar_cubo(ruta=RUTA_CSV, dir_cache=DIR_CACHE, dir_nuevos=DIR_NUEVOS):
+    actualizacion = actualizar_cache(ruta, dir_cache, dir_nuevos)
+    return pd.read_parquet(rutas_cache(ruta, dir_cache)['cubo']), actualizacion
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ingesta de datos de dengue')
+    parser.add_argument('ruta', nargs='?', default=RUTA_CSV)
+    parser.add_argument('--memoria', action='store_true',
+                        help='compara la memoria del CSV crudo con la representación compacta')
+    parser.add_argument('--bloques', action='store_true',
+                        help='reconstruye el cubo leyendo el CSV por bloques y muestra el rendimiento')
+    args = parser.parse_args()
+
+    if args.memoria:
+        original = pd.read_csv(args.ruta)
+        with pd.option_context('display.width', 120, 'display.max_columns', None):
+            print(reporte_memoria(original, compactar_tipos(original)))
+    elif args.bloques:
+        bytes_csv = os.path.getsize(args.ruta)
+        bloques = []
+
+        def mostrar(bloque):
+            bloques.append(bloque)
+            print(f'bloque {bloque.numero:>4}: {bloque.filas:>10,} filas en {bloque.segundos:6.2f} s '
+                  f'({bloque.filas_por_segundo:>12,.0f} filas/s, memoria máx. {bloque.memoria_max_mb:,.0f} MB)')
+
+        os.makedirs(DIR_CACHE, exist_ok=True)
+        inicio = time.perf_counter()
+        actualizacion = _reconstruir(args.ruta, rutas_cache(args.ruta), firma_archivo(args.ruta),
+                                     archivos_nuevos(), por_bloques=True, al_procesar=mostrar)
+        segundos = time.perf_counter() - inicio
+        filas = sum(bloque.filas for bloque in bloques)
+        print(f'Total: {filas:,} filas, {bytes_csv / 1024 ** 2:,.1f} MB en {segundos:.2f} s '
+              f'({filas / segundos:,.0f} filas/s, {bytes_csv / 1024 ** 2 / segundos:,.1f} MB/s, '
+              f'memoria máx. {_memoria_max_mb():,.0f} MB)')
+    else:
+        actualizacion = actualizar_cache(args.ruta)
+        print(f'Ingesta {actualizacion.tipo}: {actualizacion.filas_nuevas:,} registros nuevos '
+              f'en {len(actualizacion.periodos)} semanas epidemiológicas')
@@ -0,0 +1,47 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# "ubigeo" (código del distrito) no agrega celdas: identifica al distrito en la jerarquía.
+DIMENSIONES = ['ano', 'semana', 'sexo', 'tipo_edad', 'departamento', 'provincia', 'distrito', 'ubigeo']
+
+
+def concatenar(tablas):
+    tablas = [tabla for tabla in tablas if len(tabla)] or tablas[:1]
+    if len(tablas) == 1:
+        return tablas[0]
+
+    columnas = {}
+    for columna in tablas[0].columns:
+        series = [tabla[columna] for tabla in tablas]
+        if any(isinstance(serie.dtype, pd.CategoricalDtype) for serie in series):
+            series = [serie.astype('category') for serie in series]
+            columnas[columna] = pd.Series(union_categoricals(series, sort_categories=True), name=columna)
+        else:
+            columnas[columna] = pd.concat(series, ignore_index=True)
+    return pd.DataFrame(columnas)
+
+
+def construir_cubo(df):
+    # Un caso sin ubigeo no se descarta al agrupar: queda con código 0.
+    df = df.assign(ubigeo=df['ubigeo'].fillna(0).astype('int32'))
+    cubo = df.groupby(DIMENSIONES, observed=True).size().reset_index(name='casos')
+    cubo['casos'] = cubo['casos'].astype('int32')
+    return cubo
+
+
+def sumar_cubos(cubos):
+    cubo = concatenar(cubos).groupby(DIMENSIONES, observed=True)['casos'].sum().reset_index()
+    cubo['casos'] = cubo['casos'].astype('int32')
+    return cubo
+
+
+def combinar_cubos(cubo, delta):
+    return sumar_cubos([cubo, delta])
+
+
+def total_casos(cubo):
+    return int(cubo['casos'].sum())
+
+
+def sumar_por(cubo, columnas):
+    return cubo.groupby(columnas, observed=True)['casos'].sum().reset_index()
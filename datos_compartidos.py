@@ -0,0 +1,80 @@
+import os
+import threading
+
+from carga_datos import RUTA_CSV, cargar_cubo, firma_archivo, version_fuentes
+from figuras import cache_figuras, invalidar_periodos
+from filtros import crear_motor
+from poblacion import RUTA_POBLACION, cargar_tabla_poblacion
+
+# Límite de memoria del dataset compartido (cubo + índices) en MB; 0 desactiva el límite.
+MAX_MB_DATOS = float(os.environ.get('DENGUEAI_MAX_MB_DATOS', 0))
+
+
+class DatosCompartidos:
+    # Un único cubo con sus índices por proceso, compartido en solo lectura por todas las
+    # sesiones del dashboard y por el servidor JSON. Se carga al primer uso y se recarga
+    # cuando cambian los archivos de origen.
+
+    def __init__(self, ruta=RUTA_CSV, max_bytes=MAX_MB_DATOS * 1024 ** 2, ruta_poblacion=RUTA_POBLACION):
+        self.ruta = ruta
+        self.ruta_poblacion = ruta_poblacion
+        self.max_bytes = max_bytes
+        self.cargas = 0
+        self._actual = None
+        # (versión, error) de la última carga fallida: no se reintenta hasta que cambien los datos.
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _version(self):
+        # La tabla de población también es parte de los datos: si cambia, se recarga el motor.
+        firma = firma_archivo(self.ruta_poblacion) if os.path.exists(self.ruta_poblacion) else None
+        return version_fuentes(self.ruta), firma
+
+    def vigente(self, version=None):
+        actual = self._actual
+        return actual is not None and actual[0] == (version or self._version())
+
+    def obtener(self):
+        version = self._version()
+        actual = self._actual
+        if actual is not None and actual[0] == version:
+            return actual[1]
+        with self._lock:
+            # Otra sesión pudo haberlo cargado mientras se esperaba el lock.
+            if not self.vigente(version):
+                if self._error is not None and self._error[0] == version:
+                    raise self._error[1].with_traceback(None)
+                poblacion_cambiada = self._actual is not None and self._actual[0][1] != version[1]
+                try:
+                    self._actual = (version, self._cargar(poblacion_cambiada))
+                except MemoryError as e:
+                    self._error = (version, e)
+                    raise
+                self._error = None
+            return self._actual[1]
+
+    def _verificar_memoria(self, memoria):
+        if self.max_bytes and memoria > self.max_bytes:
+            raise MemoryError(f'El dataset ocupa {memoria / 1024 ** 2:,.1f} MB y supera el límite de '
+                              f'{self.max_bytes / 1024 ** 2:,.1f} MB (DENGUEAI_MAX_MB_DATOS)')
+
+    def _cargar(self, poblacion_cambiada=False):
+        cubo, actualizacion = cargar_cubo(self.ruta)
+        # El cache en disco ya se actualizó: las figuras se invalidan aunque el límite falle.
+        if actualizacion.tipo == 'completa' or poblacion_cambiada:
+            cache_figuras.invalidar()
+        else:
+            invalidar_periodos(actualizacion.periodos)
+        # El cubo solo ya es una cota inferior: si la supera no se construyen los índices.
+        self._verificar_memoria(int(cubo.memory_usage(deep=True).sum()))
+        motor = crear_motor(cubo, cargar_tabla_poblacion(self.ruta_poblacion))
+        self._verificar_memoria(motor.memoria_bytes())
+        self.cargas += 1
+        return motor
+
+    def memoria_bytes(self):
+        actual = self._actual
+        return actual[1].memoria_bytes() if actual is not None else 0
+
+
+datos = DatosCompartidos()
@@ -0,0 +1,183 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Provincias por departamento según la división política del Perú (196 en total).
+PROVINCIAS_POR_DEPARTAMENTO = {
+    'AMAZONAS': 7, 'ANCASH': 20, 'APURIMAC': 7, 'AREQUIPA': 8, 'AYACUCHO': 11,
+    'CAJAMARCA': 13, 'CALLAO': 1, 'CUSCO': 13, 'HUANCAVELICA': 7, 'HUANUCO': 11,
+    'ICA': 5, 'JUNIN': 9, 'LA LIBERTAD': 12, 'LAMBAYEQUE': 3, 'LIMA': 10,
+    'LORETO': 8, 'MADRE DE DIOS': 3, 'MOQUEGUA': 3, 'PASCO': 3, 'PIURA': 8,
+    'PUNO': 13, 'SAN MARTIN': 10, 'TACNA': 4, 'TUMBES': 3, 'UCAYALI': 4,
+}
+
+# Peso relativo de cada departamento; el dengue se concentra en la costa norte y la selva.
+PESO_DEPARTAMENTO = {
+    'PIURA': 30, 'LAMBAYEQUE': 12, 'TUMBES': 10, 'LORETO': 10, 'SAN MARTIN': 9,
+    'ICA': 8, 'LA LIBERTAD': 8, 'UCAYALI': 7, 'CAJAMARCA': 5, 'JUNIN': 5,
+    'AMAZONAS': 4, 'LIMA': 4, 'MADRE DE DIOS': 4, 'CUSCO': 3, 'HUANUCO': 3,
+    'ANCASH': 3, 'AYACUCHO': 2, 'PASCO': 1, 'CALLAO': 1, 'PUNO': 0.5,
+    'AREQUIPA': 0.2, 'APURIMAC': 0.2, 'HUANCAVELICA': 0.2, 'MOQUEGUA': 0.1, 'TACNA': 0.1,
+}
+
+GRUPOS_EDAD = [
+    ('NIÑOS', 0, 11),
+    ('ADOLESCENTES', 12, 17),
+    ('JOVENES', 18, 29),
+    ('ADULTOS', 30, 59),
+    ('ADULTOS MAYORES', 60, 95),
+]
+PESO_GRUPO_EDAD = [0.2, 0.12, 0.22, 0.36, 0.1]
+
+ENFERMEDADES = ['DENGUE SIN SEÑALES DE ALARMA', 'DENGUE CON SEÑALES DE ALARMA', 'DENGUE GRAVE']
+PESO_ENFERMEDAD = [0.85, 0.14, 0.01]
+
+AÑOS = tuple(range(2015, 2025))
+FILAS_POR_BLOQUE = 1_000_000
+
+
+def generar_unidades(semilla=0):
+    # Una fila por distrito, con ubigeo DDPPdd y un peso de casos sesgado (pocos distritos
+    # concentran la mayoría de casos, como en los datos reales).
+    rng = np.random.default_rng(semilla)
+    filas = []
+    for d, (departamento, n_provincias) in enumerate(PROVINCIAS_POR_DEPARTAMENTO.items(), start=1):
+        for p in range(1, n_provincias + 1):
+            provincia = departamento if p == 1 else f'PROV {d:02d}{p:02d}'
+            for k in range(1, int(rng.integers(3, 17)) + 1):
+                distrito = provincia if k == 1 else f'DIST {d:02d}{p:02d}{k:02d}'
+                filas.append((departamento, provincia, distrito, d * 10000 + p * 100 + k))
+    unidades = pd.DataFrame(filas, columns=['departamento', 'provincia', 'distrito', 'ubigeo'])
+
+    peso = (rng.pareto(1.5, len(unidades)) + 0.1) * unidades['departamento'].map(PESO_DEPARTAMENTO)
+    unidades['peso'] = peso / peso.sum()
+    return unidades
+
+
+def generar_bloque(unidades, n, rng, años=AÑOS):
+    indices = rng.choice(len(unidades), n, p=unidades['peso'].to_numpy())
+    bloque = unidades.iloc[indices, :4].reset_index(drop=True)
+
+    # Años con brotes de distinta intensidad y una estación que alcanza su pico hacia la semana 12.
+    peso_años = np.random.default_rng(len(años)).uniform(0.3, 1.5, len(años))
+    semanas = np.where(rng.random(n) < 0.8, rng.normal(12, 6, n).round(), rng.integers(1, 53, n))
+    grupos = rng.choice(len(GRUPOS_EDAD), n, p=PESO_GRUPO_EDAD)
+    minimos = np.array([minimo for _, minimo, _ in GRUPOS_EDAD])
+    maximos = np.array([maximo for _, _, maximo in GRUPOS_EDAD])
+
+    bloque.insert(3, 'enfermedad', np.array(ENFERMEDADES)[rng.choice(len(ENFERMEDADES), n, p=PESO_ENFERMEDAD)])
+    bloque.insert(4, 'ano', rng.choice(np.array(años), n, p=peso_años / peso_años.sum()))
+    bloque.insert(5, 'semana', np.clip(semanas, 1, 52).astype(int))
+    bloque['edad'] = rng.integers(minimos[grupos], maximos[grupos] + 1)
+    bloque['tipo_edad'] = np.array([nombre for nombre, _, _ in GRUPOS_EDAD])[grupos]
+    bloque['sexo'] = rng.choice(np.array(['M', 'F']), n)
+    return bloque
+
+
+def generar_csv(ruta, filas, años=AÑOS, semilla=0, filas_por_bloque=FILAS_POR_BLOQUE):
+    # Se escribe por bloques para poder generar decenas de millones de filas con memoria acotada.
+    unidades = generar_unidades(semilla)
+    rng = np.random.default_rng(semilla + 1)
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'w', encoding='utf-8', newline='') as archivo:
+        for inicio in range(0, filas, filas_por_bloque):
+            bloque = generar_bloque(unidades, min(filas_por_bloque, filas - inicio), rng, años)
+            bloque.to_csv(archivo, index=False, header=inicio == 0)
+    os.replace(temporal, ruta)
+    return unidades
+
+
+def generar_poblacion(unidades, años=AÑOS, semilla=0, total=33_000_000, crecimiento=0.01):
+    # Población por distrito y año con el formato de poblacion.csv: distritos de tamaño muy
+    # desigual que suman ~`total` en el primer año y crecen ~1 % anual.
+    rng = np.random.default_rng(semilla + 2)
+    base = rng.lognormal(0, 1.2, len(unidades))
+    base = base / base.sum() * total
+    años = np.asarray(años)
+    factores = (1 + crecimiento) ** (años - años[0])
+    poblacion = unidades.loc[unidades.index.repeat(len(años)), ['departamento', 'provincia', 'distrito']]
+    poblacion['ano'] = np.tile(años, len(unidades))
+    poblacion['poblacion'] = (np.repeat(base, len(años)) * np.tile(factores, len(unidades))).round().astype(int)
+    return poblacion.reset_index(drop=True)
+
+
+def _borde(a, b, rng, vertices):
+    # Borde con vértices intermedios perturbados; se genera en un sentido canónico para que
+    # los polígonos vecinos compartan exactamente los mismos puntos.
+    inicio, fin = (a, b) if a <= b else (b, a)
+    t = np.linspace(0, 1, vertices)[:, None]
+    puntos = np.asarray(inicio) + (np.asarray(fin) - np.asarray(inicio)) * t
+    puntos[1:-1] += rng.normal(0, 0.01, (vertices - 2, 2))
+    puntos = puntos.round(6).tolist()
+    return puntos if (a, b) == (inicio, fin) else puntos[::-1]
+
+
+def _grilla(unidades, propiedades, lado, semilla, vertices=12):
+    rng = np.random.default_rng(semilla)
+    n_columnas = int(np.ceil(np.sqrt(len(unidades))))
+    bordes = {}
+    features = []
+    for i, unidad in enumerate(unidades.itertuples(index=False)):
+        fila, columna = divmod(i, n_columnas)
+        x, y = -81 + columna * lado, -18 + fila * lado
+        esquinas = [(x, y), (x + lado, y), (x + lado, y + lado), (x, y + lado)]
+        esquinas = [(round(px, 6), round(py, 6)) for px, py in esquinas]
+        anillo = []
+        for a, b in zip(esquinas, esquinas[1:] + esquinas[:1]):
+            clave = (min(a, b), max(a, b))
+            if clave not in bordes:
+                bordes[clave] = _borde(clave[0], clave[1], rng, vertices)
+            borde = bordes[clave] if a == clave[0] else bordes[clave][::-1]
+            anillo += borde[:-1]
+        anillo.append(anillo[0])
+        features.append({
+            'type': 'Feature',
+            'properties': {propiedad: getattr(unidad, campo) for propiedad, campo in propiedades.items()},
+            'geometry': {'type': 'Polygon', 'coordinates': [anillo]},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def generar_limites(unidades, directorio, semilla=0):
+    # Límites en grilla con bordes compartidos, con los mismos nombres de archivo y
+    # propiedades que peru-geojson, para medir el mapa sin descargar nada.
+    from geometrias import ARCHIVOS
+
+    niveles = {
+        'Departamento': (['departamento'], {'NOMBDEP': 'departamento'}, 2.0),
+        'Provincia': (['departamento', 'provincia'], {'NOMBDEP': 'departamento', 'NOMBPROV': 'provincia'}, 0.8),
+        'Distrito': (['departamento', 'provincia', 'distrito'],
+                     {'NOMBDEP': 'departamento', 'NOMBPROV': 'provincia', 'NOMBDIST': 'distrito'}, 0.25),
+    }
+    os.makedirs(directorio, exist_ok=True)
+    for nivel, (columnas, propiedades, lado) in niveles.items():
+        geojson = _grilla(unidades[columnas].drop_duplicates(), propiedades, lado, semilla)
+        with open(os.path.join(directorio, ARCHIVOS[nivel]), 'w', encoding='utf-8') as archivo:
+            json.dump(geojson, archivo, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Genera datos de dengue sintéticos con la forma de datos_dengue.csv')
+    parser.add_argument('filas', type=int)
+    parser.add_argument('--salida', default='datos_sinteticos.csv')
+    parser.add_argument('--desde', type=int, default=AÑOS[0])
+    parser.add_argument('--hasta', type=int, default=AÑOS[-1])
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--limites', metavar='DIRECTORIO',
+                        help='genera también límites GeoJSON sintéticos para estas unidades')
+    parser.add_argument('--poblacion', metavar='RUTA',
+                        help='genera también una tabla de población por distrito y año')
+    args = parser.parse_args()
+
+    unidades = generar_csv(args.salida, args.filas, tuple(range(args.desde, args.hasta + 1)), args.semilla)
+    if args.limites:
+        generar_limites(unidades, args.limites, args.semilla)
+    if args.poblacion:
+        años = tuple(range(args.desde, args.hasta + 1))
+        generar_poblacion(unidades, años, args.semilla).to_csv(args.poblacion, index=False)
+    print(f'{args.filas:,} filas en {args.salida}: {unidades["departamento"].nunique()} departamentos, '
+          f'{unidades["provincia"].nunique()} provincias, {len(unidades)} distritos')
@@ -0,0 +1,433 @@
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from filtros import clave_estado
+from series import AÑOS_CANAL, fecha_semana, promedio_movil, reducir_serie, serie_continua
+
+MAX_FIGURAS = 512
+MAX_BYTES_FIGURAS = 64 * 1024 * 1024
+
+FUENTE = dict(family="Helvetica Neue, Arial", size=12, color="#E0E0E0")
+ORDEN_EDAD = ['NIÑOS', 'ADOLESCENTES', 'JOVENES', 'ADULTOS', 'ADULTOS MAYORES']
+COLORES_RIESGO = {
+    'ALTO': '#FF5252',
+    'MEDIO': '#FFC107',
+    'BAJO': '#66BB6A'
+}
+ZONAS_CANAL = [
+    ('inferior', 'Zona de éxito', 'rgba(102, 187, 106, 0.25)'),
+    ('mediana', 'Zona de seguridad', 'rgba(255, 193, 7, 0.25)'),
+    ('superior', 'Zona de alerta', 'rgba(255, 112, 67, 0.25)'),
+]
+FACTORES_BROTE = ['Temperatura', 'Precipitación', 'Hacinamiento',
+                  'Acceso a agua', 'Control vectorial', 'Urbanización']
+
+
+class CacheFiguras:
+
+    def __init__(self, max_entradas=MAX_FIGURAS, max_bytes=MAX_BYTES_FIGURAS):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def obtener_json(self, clave, construir):
+        with self._lock:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self._entradas[clave]
+            self.fallos += 1
+
+        figura = construir()
+        figura_json = figura.to_json() if figura is not None else None
+        self._guardar(clave, figura_json)
+        return figura_json
+
+    def _guardar(self, clave, figura_json):
+        tamaño = len(figura_json) if figura_json is not None else 0
+        if tamaño > self.max_bytes:
+            return
+        with self._lock:
+            if clave in self._entradas:
+                return
+            self._entradas[clave] = figura_json
+            self.bytes += tamaño
+            while len(self._entradas) > self.max_entradas or self.bytes > self.max_bytes:
+                _, descartada = self._entradas.popitem(last=False)
+                self.bytes -= len(descartada) if descartada is not None else 0
+
+    def invalidar(self, condicion=None):
+        with self._lock:
+            claves = [clave for clave in self._entradas if condicion is None or condicion(clave)]
+            for clave in claves:
+                descartada = self._entradas.pop(clave)
+                self.bytes -= len(descartada) if descartada is not None else 0
+            return len(claves)
+
+
+cache_figuras = CacheFiguras()
+
+
+# Partes del estado de la vista de las que depende cada panel. Un cambio en otra parte
+# (p. ej. el nivel geográfico para la evolución semanal) no invalida sus figuras.
+DEPENDENCIAS_PANELES = {
+    'top_geos': ('nivel', 'año', 'rangos', 'valores'),
+    'evolucion': ('año', 'rangos', 'valores'),
+    'demografia': ('rangos', 'valores'),
+    'riesgo': ('nivel', 'rangos', 'valores'),
+    'factores': (),
+}
+# Años previos a la vista que usan las figuras de cada panel (el canal endémico de la
+# evolución semanal y la base del puntaje de riesgo). Datos nuevos de esos años también
+# invalidan sus figuras.
+HISTORIA_PANELES = {
+    'evolucion': AÑOS_CANAL,
+    'riesgo': AÑOS_CANAL,
+}
+
+
+def clave_vista(estado, historia=0):
+    # El periodo (años, semanas) queda fuera del hash para poder invalidar por semanas nuevas.
+    # Con `historia`, el periodo abarca además esos años previos, en todas sus semanas.
+    rangos = estado.get('rangos', {})
+    periodo = tuple(tuple(rangos[columna]) if columna in rangos else None for columna in ('ano', 'semana'))
+    if historia:
+        años = periodo[0]
+        periodo = ((años[0] - historia, años[1]) if años is not None else None, None)
+    return clave_estado(estado), periodo
+
+
+def claves_paneles(estado):
+    return {panel: clave_vista({parte: estado[parte] for parte in partes}, HISTORIA_PANELES.get(panel, 0))
+            for panel, partes in DEPENDENCIAS_PANELES.items()}
+
+
+def _periodo_afectado(periodo, periodos_nuevos):
+    años, semanas = periodo
+    return any((años is None or años[0] <= ano <= años[1]) and
+               (semanas is None or semanas[0] <= semana <= semanas[1])
+               for ano, semana in periodos_nuevos)
+
+
+def figura_cacheada(nombre, clave, construir, cache=cache_figuras):
+    figura_json = cache.obtener_json((nombre, *clave), construir)
+    if figura_json is None:
+        return None
+    # El JSON viene de una figura ya validada; validarlo otra vez cuesta ~10x más que construirla.
+    return go.Figure(json.loads(figura_json), _validate=False)
+
+
+def invalidar_periodos(periodos_nuevos, cache=cache_figuras):
+    return cache.invalidar(lambda clave: _periodo_afectado(clave[2], periodos_nuevos))
+
+
+def _ejes_oscuros(fig):
+    fig.update_xaxes(gridcolor='#333333', zerolinecolor='#333333')
+    fig.update_yaxes(gridcolor='#333333', zerolinecolor='#333333')
+
+
+def figura_top_geos(top_geos, geo_column, nivel_geografico, etiqueta_año, medida='casos'):
+    # medida: 'casos' o 'incidencia' (por 100 000 hab., ya calculada en los agregados).
+    top_geos = top_geos.assign(**{
+        geo_column: top_geos[geo_column].astype(str),
+        'porcentaje': top_geos['casos'] / top_geos['casos'].sum() * 100,
+    })
+    if medida == 'incidencia':
+        texto = top_geos['casos'].apply(lambda x: f'{x:,} casos')
+    else:
+        texto = top_geos['porcentaje'].apply(lambda x: f'{x:.1f}%')
+
+    fig = px.bar(
+        top_geos,
+        y=geo_column,
+        x=medida,
+        orientation='h',
+        text=texto,
+        color=medida,
+        color_continuous_scale='Reds',
+        title=f'Top 10 {nivel_geografico}s - {etiqueta_año}'
+    )
+
+    fig.update_layout(
+        height=550,
+        xaxis_title="Incidencia por 100 000 hab." if medida == 'incidencia' else "Número de casos",
+        yaxis_title="",
+        yaxis={'categoryorder': 'total ascending'},
+        font=FUENTE,
+        margin=dict(l=10, r=10, t=40, b=20),
+        coloraxis_showscale=False,
+        plot_bgcolor='#1E1E1E',
+        paper_bgcolor='#1E1E1E',
+    )
+    _ejes_oscuros(fig)
+    return fig
+
+
+def figura_evolucion(casos_semana, etiqueta_año, canal=None, pronostico=None):
+    # casos_semana: casos por (ano, semana). Con varios años el eje es continuo (fechas) y la
+    # serie se reduce con LTTB para acotar el tamaño de la figura. `canal`: bandas del canal
+    # endémico por (ano, semana), dibujadas detrás de los casos. `pronostico`: semanas
+    # siguientes con su intervalo (ver pronostico.py).
+    if casos_semana.empty:
+        return None
+
+    serie = serie_continua(casos_semana)
+    serie['promedio_movil'] = promedio_movil(serie['casos'])
+    if canal is not None and not canal.empty:
+        serie = serie.merge(canal, on=['ano', 'semana'], how='left')
+    con_pronostico = pronostico is not None and not pronostico.empty
+    if con_pronostico:
+        pronostico = pronostico.assign(fecha=fecha_semana(pronostico['ano'], pronostico['semana']))
+    # Un pronóstico que pasa al año siguiente también necesita el eje de fechas.
+    varios_años = serie['ano'].nunique() > 1 or (con_pronostico and not pronostico['ano'].isin(serie['ano']).all())
+    eje = 'fecha' if varios_años else 'semana'
+    pico = serie.loc[serie['casos'].idxmax()]
+    serie = reducir_serie(serie)
+
+    fig = go.Figure()
+
+    if 'mediana' in serie:
+        # Zonas de éxito, seguridad y alerta; por encima de la banda superior, epidemia.
+        for banda, nombre, color in ZONAS_CANAL:
+            fig.add_trace(go.Scatter(
+                x=serie[eje],
+                y=serie[banda],
+                mode='lines',
+                name=nombre,
+                line=dict(width=0),
+                fill='tozeroy' if banda == 'inferior' else 'tonexty',
+                fillcolor=color,
+                connectgaps=False
+            ))
+
+    fig.add_trace(go.Bar(
+        x=serie[eje],
+        y=serie['casos'],
+        name='Casos semanales',
+        marker_color='rgba(255, 82, 82, 0.7)'
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=serie[eje],
+        y=serie['promedio_movil'],
+        mode='lines',
+        name='Promedio móvil (3 semanas)',
+        line=dict(color='rgba(144, 202, 249, 0.8)', width=3)
+    ))
+
+    if con_pronostico:
+        fig.add_trace(go.Scatter(
+            x=pronostico[eje],
+            y=pronostico['superior'],
+            mode='lines',
+            line=dict(width=0),
+            showlegend=False,
+            hoverinfo='skip'
+        ))
+        fig.add_trace(go.Scatter(
+            x=pronostico[eje],
+            y=pronostico['inferior'],
+            mode='lines',
+            name='Intervalo del pronóstico',
+            line=dict(width=0),
+            fill='tonexty',
+            fillcolor='rgba(186, 104, 200, 0.2)'
+        ))
+        fig.add_trace(go.Scatter(
+            x=pronostico[eje],
+            y=pronostico['pronostico'],
+            mode='lines+markers',
+            name='Pronóstico',
+            line=dict(color='#BA68C8', width=2, dash='dash')
+        ))
+
+    fig.update_layout(
+        title=f'Evolución semanal de casos de dengue en {etiqueta_año}',
+        xaxis_title="Semana Epidemiológica" if not varios_años else "Semana Epidemiológica (inicio)",
+        yaxis_title="Número de casos",
+        hovermode="x unified",
+        legend=dict(orientation="h", yanchor="bottom",
+                    y=1.02, xanchor="center", x=0.5),
+        font=FUENTE,
+        height=400,
+        margin=dict(l=50, r=20, t=70, b=50),
+        plot_bgcolor='rgba(30, 30, 30, 0.5)',
+        paper_bgcolor='#121212'
+    )
+    _ejes_oscuros(fig)
+
+    if len(serie) > 3:
+        fig.add_annotation(
+            x=pico[eje],
+            y=pico['casos'],
+            text=f"Pico: {int(pico['casos'])} casos" + (f" (S{int(pico['semana'])}-{int(pico['ano'])})"
+                                                         if varios_años else ""),
+            showarrow=True,
+            arrowhead=2,
+            arrowsize=1,
+            arrowcolor="#FF5252",
+            ax=0,
+            ay=-40,
+            font=dict(color="#E0E0E0")
+        )
+    return fig
+
+
+def figura_sexo(casos_sexo):
+    casos_sexo = casos_sexo.copy()
+    casos_sexo.columns = ['Sexo', 'Casos']
+    casos_sexo['Sexo'] = casos_sexo['Sexo'].astype(str)
+    casos_sexo['Porcentaje'] = casos_sexo['Casos'] / casos_sexo['Casos'].sum() * 100
+
+    fig = px.pie(
+        casos_sexo,
+        values='Casos',
+        names='Sexo',
+        title='Distribución por Sexo',
+        color_discrete_sequence=px.colors.sequential.Reds_r,
+        hole=0.4,
+        hover_data=['Porcentaje']
+    )
+
+    fig.update_traces(
+        textposition='inside',
+        textinfo='percent+label',
+        hovertemplate='<b>%{label}</b><br>Casos: %{value}<br>Porcentaje: %{customdata[0]:.1f}%'
+    )
+
+    fig.update_layout(
+        font=FUENTE,
+        margin=dict(l=20, r=20, t=50, b=20),
+        legend=dict(orientation="h", yanchor="bottom",
+                    y=-0.2, xanchor="center", x=0.5),
+        paper_bgcolor='#121212'
+    )
+    return fig
+
+
+def figura_edad(casos_edad):
+    casos_edad = casos_edad.copy()
+    casos_edad.columns = ['Tipo de Edad', 'Casos']
+    casos_edad['Tipo de Edad'] = casos_edad['Tipo de Edad'].astype(str)
+    casos_edad['Porcentaje'] = casos_edad['Casos'] / casos_edad['Casos'].sum() * 100
+    casos_edad['orden'] = casos_edad['Tipo de Edad'].apply(
+        lambda x: ORDEN_EDAD.index(x) if x in ORDEN_EDAD else 999)
+    casos_edad = casos_edad.sort_values('orden')
+
+    fig = px.bar(
+        casos_edad,
+        y='Tipo de Edad',
+        x='Casos',
+        orientation='h',
+        title='Distribución por Grupo Etario',
+        color='Casos',
+        color_continuous_scale='Reds',
+        text=casos_edad['Porcentaje'].apply(lambda x: f'{x:.1f}%')
+    )
+
+    fig.update_layout(
+        font=FUENTE,
+        margin=dict(l=20, r=20, t=50, b=20),
+        xaxis_title="Número de casos",
+        yaxis_title="",
+        coloraxis_showscale=False,
+        plot_bgcolor='#1E1E1E',
+        paper_bgcolor='#1E1E1E',
+    )
+    _ejes_oscuros(fig)
+    return fig
+
+
+def categoria_riesgo(puntajes):
+    puntajes = np.asarray(puntajes)
+    return np.select([puntajes >= 80, puntajes >= 50], ["ALTO", "MEDIO"], "BAJO")
+
+
+def figura_riesgo(riesgo, geo_column):
+    # Un indicador (barra) por unidad, todos en una sola figura: una franja horizontal por
+    # unidad, con el nombre y el detalle a la izquierda.
+    colores = [COLORES_RIESGO[categoria] for categoria in categoria_riesgo(riesgo['puntaje_riesgo'])]
+    alto = 1 / max(len(riesgo), 1)
+    fig = go.Figure()
+    for i, (fila, color) in enumerate(zip(riesgo.itertuples(), colores)):
+        fig.add_trace(go.Indicator(
+            mode="gauge+number",
+            value=fila.puntaje_riesgo,
+            domain={'x': [0.45, 1], 'y': [1 - (i + 1) * alto + 0.15 * alto, 1 - i * alto - 0.15 * alto]},
+            title={'text': f"{getattr(fila, geo_column)}<br><span style='font-size: 11px; color: #B0B0B0'>"
+                           f"{fila.casos_recientes} casos · {fila.crecimiento:+.0%} sem. · "
+                           f"{fila.exceso_basal:+.0%} basal</span>",
+                   'font': {'color': '#E0E0E0', 'size': 13}},
+            gauge={
+                'shape': 'bullet',
+                'axis': {'range': [0, 100], 'tickcolor': "#E0E0E0"},
+                'bar': {'color': color},
+                'steps': [
+                    {'range': [0, 50], 'color': 'rgba(102, 187, 106, 0.3)'},
+                    {'range': [50, 80], 'color': 'rgba(255, 193, 7, 0.3)'},
+                    {'range': [80, 100], 'color': 'rgba(255, 82, 82, 0.3)'}
+                ],
+                'threshold': {
+                    'line': {'color': "white", 'width': 2},
+                    'thickness': 0.75,
+                    'value': fila.puntaje_riesgo
+                }
+            }
+        ))
+
+    fig.update_layout(
+        height=70 * len(riesgo) + 20,
+        margin=dict(l=10, r=30, t=10, b=10),
+        paper_bgcolor='#1E1E1E',
+        font=dict(color="#E0E0E0", size=12)
+    )
+    return fig
+
+
+def figura_factores():
+    valores = np.random.uniform(0.4, 0.9, size=len(FACTORES_BROTE))
+
+    categorias_cerrado = FACTORES_BROTE + [FACTORES_BROTE[0]]
+    valores_cerrado = np.append(valores, valores[0])
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Scatterpolar(
+        r=valores_cerrado,
+        theta=categorias_cerrado,
+        fill='toself',
+        fillcolor='rgba(255, 82, 82, 0.5)',
+        line=dict(color='#FF5252')
+    ))
+
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 1],
+                showticklabels=False,
+                gridcolor="#333333"
+            ),
+            angularaxis=dict(
+                gridcolor="#333333"
+            ),
+            bgcolor="#1E1E1E"
+        ),
+        showlegend=False,
+        margin=dict(l=80, r=80, t=20, b=80),
+        paper_bgcolor='#1E1E1E',
+        font=dict(color="#E0E0E0")
+    )
+    return fig
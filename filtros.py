@@ -0,0 +1,170 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from jerarquia import Jerarquia
+from poblacion import Poblacion
+
+COLUMNAS_RANGO = ['ano', 'semana']
+COLUMNAS_VALOR = ['sexo', 'tipo_edad', 'departamento', 'provincia', 'distrito']
+
+# Por encima de esta cardinalidad un bitmap por valor ocupa demasiado y se
+# guardan en su lugar las posiciones de cada valor (índice invertido).
+MAX_VALORES_BITMAP = 64
+# Agregados pequeños memorizados por motor (ver MotorFiltros.agregado).
+MAX_AGREGADOS = 256
+
+_BITS_POR_BYTE = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+Seleccion = namedtuple('Seleccion', ['filas', 'conteos'])
+
+
+def codigos_categoria(serie, valores):
+    codigos = serie.cat.categories.get_indexer(list(valores))
+    return codigos[codigos >= 0]
+
+
+def clave_estado(estado):
+    texto = json.dumps(estado, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def crear_motor(cubo, tabla_poblacion=None):
+    # Motor con la jerarquía geográfica: el cubo gana la columna "unidad" (código de
+    # distrito) para filtrar provincias y distritos por código, sin ambigüedad entre homónimos.
+    # Con una tabla de población, se une a la jerarquía una sola vez aquí.
+    jerarquia = Jerarquia(cubo)
+    poblacion = Poblacion(tabla_poblacion, jerarquia) if tabla_poblacion is not None else None
+    return MotorFiltros(cubo.assign(unidad=jerarquia.categorias_filas()),
+                        columnas_valor=COLUMNAS_VALOR + ['unidad'], jerarquia=jerarquia, poblacion=poblacion)
+
+
+def _contar_bits(bitmap):
+    return int(_BITS_POR_BYTE[bitmap].sum())
+
+
+class MotorFiltros:
+
+    def __init__(self, tabla, columnas_rango=COLUMNAS_RANGO, columnas_valor=COLUMNAS_VALOR, jerarquia=None,
+                 poblacion=None):
+        self.tabla = tabla
+        self.n_filas = len(tabla)
+        self.jerarquia = jerarquia
+        self.poblacion = poblacion
+
+        self._ordenes = {}
+        for columna in columnas_rango:
+            valores = tabla[columna].to_numpy()
+            orden = np.argsort(valores, kind='stable')
+            self._ordenes[columna] = (orden, valores[orden])
+
+        self._bitmaps = {}
+        self._posiciones = {}
+        for columna in columnas_valor:
+            serie = tabla[columna]
+            codigos = serie.cat.codes.to_numpy()
+            n_valores = len(serie.cat.categories)
+            if n_valores <= MAX_VALORES_BITMAP:
+                self._bitmaps[columna] = np.array(
+                    [np.packbits(codigos == codigo) for codigo in range(n_valores)],
+                    dtype=np.uint8).reshape(n_valores, -1)
+            else:
+                orden = np.argsort(codigos, kind='stable')
+                limites = np.searchsorted(codigos[orden], np.arange(n_valores + 1))
+                self._posiciones[columna] = (orden, limites)
+
+        # Los índices se comparten entre sesiones; se marcan de solo lectura.
+        for arreglo in self._indices():
+            arreglo.flags.writeable = False
+
+        self._agregados = OrderedDict()
+        self._lock_agregados = threading.Lock()
+
+    def _indices(self):
+        return ([arreglo for par in self._ordenes.values() for arreglo in par]
+                + list(self._bitmaps.values())
+                + [arreglo for par in self._posiciones.values() for arreglo in par])
+
+    def memoria_bytes(self):
+        poblacion = self.poblacion.memoria_bytes() if self.poblacion is not None else 0
+        return (int(self.tabla.memory_usage(deep=True).sum()) + sum(arreglo.nbytes for arreglo in self._indices())
+                + poblacion)
+
+    def agregado(self, clave, construir, max_entradas=MAX_AGREGADOS):
+        # Memoriza agregados pequeños derivados de una selección (p. ej. casos por año y
+        # semana). Viven lo mismo que el motor, es decir, hasta que cambian los datos.
+        with self._lock_agregados:
+            if clave in self._agregados:
+                self._agregados.move_to_end(clave)
+                return self._agregados[clave]
+        valor = construir()
+        with self._lock_agregados:
+            self._agregados[clave] = valor
+            while len(self._agregados) > max_entradas:
+                self._agregados.popitem(last=False)
+        return valor
+
+    def _bitmap_desde_posiciones(self, posiciones):
+        mascara = np.zeros(self.n_filas, dtype=bool)
+        mascara[posiciones] = True
+        return np.packbits(mascara)
+
+    def _bitmap_rango(self, columna, minimo, maximo):
+        orden, ordenados = self._ordenes[columna]
+        inicio = np.searchsorted(ordenados, minimo, side='left')
+        fin = np.searchsorted(ordenados, maximo, side='right')
+        return self._bitmap_desde_posiciones(orden[inicio:fin])
+
+    def _bitmap_valores(self, columna, valores):
+        codigos = codigos_categoria(self.tabla[columna], valores)
+        if columna in self._bitmaps:
+            return np.bitwise_or.reduce(self._bitmaps[columna][codigos], axis=0)
+        orden, limites = self._posiciones[columna]
+        posiciones = [orden[limites[codigo]:limites[codigo + 1]] for codigo in codigos]
+        return self._bitmap_desde_posiciones(np.concatenate(posiciones) if posiciones else [])
+
+    def _rango_completo(self, columna, minimo, maximo):
+        ordenados = self._ordenes[columna][1]
+        return self.n_filas == 0 or (minimo <= ordenados[0] and ordenados[-1] <= maximo)
+
+    def _todos_los_valores(self, columna, valores):
+        serie = self.tabla[columna]
+        return len(codigos_categoria(serie, set(valores))) == len(serie.cat.categories)
+
+    def normalizar(self, rangos=None, valores=None):
+        # Forma canónica de una selección: sin predicados que no descartan nada y
+        # con los valores ordenados, para que selecciones equivalentes compartan clave.
+        rangos = {columna: [int(minimo), int(maximo)]
+                  for columna, (minimo, maximo) in sorted((rangos or {}).items())
+                  if not self._rango_completo(columna, minimo, maximo)}
+        valores = {columna: sorted(set(map(str, lista)))
+                   for columna, lista in sorted((valores or {}).items())
+                   if not self._todos_los_valores(columna, lista)}
+        return {'rangos': rangos, 'valores': valores}
+
+    def seleccionar(self, rangos=None, valores=None):
+        seleccion = None
+        conteos = []
+
+        predicados = [(columna, self._bitmap_rango, limites)
+                      for columna, limites in (rangos or {}).items()
+                      if not self._rango_completo(columna, *limites)]
+        predicados += [(columna, self._bitmap_valores, (lista,))
+                       for columna, lista in (valores or {}).items()
+                       if not self._todos_los_valores(columna, lista)]
+
+        for columna, construir, argumentos in predicados:
+            bitmap = construir(columna, *argumentos)
+            if seleccion is None:
+                seleccion = bitmap
+            else:
+                np.bitwise_and(seleccion, bitmap, out=seleccion)
+            conteos.append((columna, _contar_bits(seleccion)))
+
+        if seleccion is None:
+            return Seleccion(np.arange(self.n_filas), conteos)
+        filas = np.flatnonzero(np.unpackbits(seleccion, count=self.n_filas))
+        return Seleccion(filas, conteos)
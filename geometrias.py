@@ -0,0 +1,399 @@
+import json
+import os
+import tempfile
+import threading
+from functools import lru_cache
+
+import numpy as np
+import requests
+
+from carga_datos import firma_archivo
+
+URL_BASE = 'https://raw.githubusercontent.com/juaneladio/peru-geojson/master/'
+DIR_GEOJSON = os.environ.get('DENGUEAI_GEOJSON', 'geojson')
+
+ARCHIVOS = {
+    'Departamento': 'peru_departamental_simple.geojson',
+    'Provincia': 'peru_provincias_simple.geojson',
+    'Distrito': 'peru_distrital_simple.geojson',
+}
+
+PROPIEDADES = {
+    'Departamento': 'NOMBDEP',
+    'Provincia': 'NOMBPROV',
+    'Distrito': 'NOMBDIST',
+}
+
+# Tolerancias en grados (0.001 ~ 110 m). 0 conserva la geometría original.
+TOLERANCIAS = (0.0, 0.001, 0.0025, 0.005)
+
+TOLERANCIA_POR_NIVEL = {
+    'Departamento': 0.001,
+    'Provincia': 0.0025,
+    'Distrito': 0.005,
+}
+
+
+def ruta_geojson(nivel, tolerancia=0.0):
+    archivo = ARCHIVOS[nivel]
+    if not tolerancia:
+        return os.path.join(DIR_GEOJSON, archivo)
+    base = os.path.splitext(archivo)[0]
+    return os.path.join(DIR_GEOJSON, 'simplificado', f'{base}_{tolerancia:g}.geojson')
+
+
+def _guardar_json(datos, ruta):
+    # Temporal con nombre único en el mismo directorio: dos escritores (hilos o procesos) del
+    # mismo archivo no se pisan el temporal, y os.replace deja siempre un archivo completo.
+    directorio = os.path.dirname(ruta) or '.'
+    os.makedirs(directorio, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directorio, suffix='.tmp',
+                                     delete=False) as archivo:
+        json.dump(datos, archivo, ensure_ascii=False, separators=(',', ':'))
+    try:
+        os.replace(archivo.name, ruta)
+    except OSError:
+        os.remove(archivo.name)
+        raise
+
+
+_locks = {}
+_lock_locks = threading.Lock()
+
+
+def _lock_archivo(ruta):
+    # Un lock por archivo de límites: lru_cache no serializa a quienes no encuentran la misma
+    # entrada, así que construir y escribir cada archivo se hace de a un hilo.
+    with _lock_locks:
+        return _locks.setdefault(ruta, threading.Lock())
+
+
+def _leer_json(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+def _firma_origen(nivel):
+    # (mtime, bytes) del GeoJSON original del nivel; None si no está en disco (p. ej. si solo
+    # se distribuyeron los simplificados).
+    ruta = ruta_geojson(nivel)
+    if not os.path.exists(ruta):
+        return None
+    firma = firma_archivo(ruta)
+    return firma['mtime_ns'], firma['bytes']
+
+
+def _ruta_firma(ruta):
+    return f'{ruta}.origen.json'
+
+
+def _vigente(ruta, firma):
+    # Un archivo simplificado sirve si se generó desde el original actual; sin original no
+    # hay con qué compararlo y se usa tal cual.
+    if not os.path.exists(ruta):
+        return False
+    if firma is None:
+        return True
+    try:
+        return tuple(_leer_json(_ruta_firma(ruta))) == firma
+    except (OSError, ValueError):
+        return False
+
+
+def _guardar_derivado(datos, ruta, firma):
+    # La firma se escribe después de los datos: si falta o no coincide, se regenera.
+    _guardar_json(datos, ruta)
+    if firma is not None:
+        _guardar_json(list(firma), _ruta_firma(ruta))
+
+
+def descargar_geojson(nivel, timeout=30):
+    respuesta = requests.get(URL_BASE + ARCHIVOS[nivel], timeout=timeout)
+    respuesta.raise_for_status()
+    datos = respuesta.json()
+    _guardar_json(datos, ruta_geojson(nivel))
+    return datos
+
+
+def _douglas_peucker(puntos, tolerancia):
+    n = len(puntos)
+    conservar = np.zeros(n, dtype=bool)
+    conservar[0] = conservar[-1] = True
+    pendientes = [(0, n - 1)]
+    while pendientes:
+        inicio, fin = pendientes.pop()
+        if fin <= inicio + 1:
+            continue
+        a, b = puntos[inicio], puntos[fin]
+        intermedios = puntos[inicio + 1:fin]
+        segmento = b - a
+        largo = np.hypot(*segmento)
+        if largo == 0:
+            distancias = np.hypot(*(intermedios - a).T)
+        else:
+            relativos = intermedios - a
+            distancias = np.abs(segmento[0] * relativos[:, 1] - segmento[1] * relativos[:, 0]) / largo
+        mayor = int(np.argmax(distancias))
+        if distancias[mayor] > tolerancia:
+            medio = inicio + 1 + mayor
+            conservar[medio] = True
+            pendientes.append((inicio, medio))
+            pendientes.append((medio, fin))
+    return puntos[conservar]
+
+
+def _simplificar_anillo(anillo, tolerancia):
+    puntos = np.asarray(anillo, dtype=float)
+    if len(puntos) <= 4:
+        return anillo
+    simplificado = _douglas_peucker(puntos, tolerancia)
+    # Un anillo cerrado necesita al menos 4 vértices; si no, se conserva el original.
+    if len(simplificado) < 4:
+        return anillo
+    return simplificado.tolist()
+
+
+def simplificar_geometria(geometria, tolerancia):
+    if geometria['type'] == 'Polygon':
+        coordenadas = [_simplificar_anillo(anillo, tolerancia) for anillo in geometria['coordinates']]
+    elif geometria['type'] == 'MultiPolygon':
+        coordenadas = [[_simplificar_anillo(anillo, tolerancia) for anillo in poligono]
+                       for poligono in geometria['coordinates']]
+    else:
+        return geometria
+    return {'type': geometria['type'], 'coordinates': coordenadas}
+
+
+def simplificar_geojson(datos, tolerancia):
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature',
+             'properties': feature['properties'],
+             'geometry': simplificar_geometria(feature['geometry'], tolerancia)}
+            for feature in datos['features']
+        ],
+    }
+
+
+def cargar_geojson(nivel, tolerancia=None):
+    if tolerancia is None:
+        tolerancia = TOLERANCIA_POR_NIVEL[nivel]
+    return _cargar_geojson(nivel, float(tolerancia), _firma_origen(nivel))
+
+
+@lru_cache(maxsize=None)
+def _cargar_geojson(nivel, tolerancia, firma):
+    # `firma` (la del original) es parte de la clave: si el original cambia, se vuelve a leer
+    # y los simplificados generados desde la versión anterior se regeneran.
+    ruta = ruta_geojson(nivel, tolerancia)
+    with _lock_archivo(ruta):
+        if not tolerancia:
+            return _leer_json(ruta) if os.path.exists(ruta) else descargar_geojson(nivel)
+        # Quien esperaba el lock encuentra el archivo que escribió el otro hilo.
+        if _vigente(ruta, firma):
+            return _leer_json(ruta)
+
+        simplificado = simplificar_geojson(_cargar_geojson(nivel, 0.0, firma), tolerancia)
+        _guardar_derivado(simplificado, ruta, firma or _firma_origen(nivel))
+        return simplificado
+
+
+def _centroide_anillo(anillo):
+    # Centroide de área (fórmula del polígono); devuelve también el área para ponderar.
+    puntos = np.asarray(anillo, dtype=float)
+    x, y = puntos[:, 0], puntos[:, 1]
+    cruz = x[:-1] * y[1:] - x[1:] * y[:-1]
+    area = cruz.sum() / 2
+    if abs(area) < 1e-12:
+        return puntos.mean(axis=0), 0.0
+    cx = ((x[:-1] + x[1:]) * cruz).sum() / (6 * area)
+    cy = ((y[:-1] + y[1:]) * cruz).sum() / (6 * area)
+    return np.array([cx, cy]), abs(area)
+
+
+def centroides(nivel):
+    # [lat, lon] de cada feature, en el mismo orden que sus límites (GeoJSON y TopoJSON).
+    return _centroides(nivel, float(TOLERANCIA_POR_NIVEL[nivel]), _firma_origen(nivel))
+
+
+@lru_cache(maxsize=None)
+def _centroides(nivel, tolerancia, firma):
+    resultado = []
+    for feature in _cargar_geojson(nivel, tolerancia, firma)['features']:
+        # Promedio de los anillos exteriores ponderado por área.
+        partes = [_centroide_anillo(poligono[0]) for poligono in _anillos(feature['geometry'])
+                  if len(poligono[0]) >= 3]
+        if not partes:
+            resultado.append([np.nan, np.nan])
+            continue
+        puntos = np.array([centro for centro, _ in partes])
+        pesos = np.array([area for _, area in partes])
+        centro = np.average(puntos, axis=0, weights=pesos) if pesos.sum() > 0 else puntos.mean(axis=0)
+        resultado.append([centro[1], centro[0]])
+    centros = np.array(resultado, dtype=float).reshape(-1, 2)
+    centros.flags.writeable = False
+    return centros
+
+
+def _anillos(geometria):
+    if geometria['type'] == 'Polygon':
+        return [geometria['coordinates']]
+    if geometria['type'] == 'MultiPolygon':
+        return geometria['coordinates']
+    return []
+
+
+def _cuantizar_anillo(anillo, origen, escala):
+    puntos = np.rint((np.asarray(anillo, dtype=float) - origen) / escala).astype(np.int64)
+    distintos = np.ones(len(puntos), dtype=bool)
+    distintos[1:] = np.any(puntos[1:] != puntos[:-1], axis=1)
+    puntos = puntos[distintos]
+    if len(puntos) > 1 and (puntos[0] == puntos[-1]).all():
+        puntos = puntos[:-1]
+    return [tuple(punto) for punto in puntos.tolist()]
+
+
+def _uniones(anillos):
+    # Un vértice es unión si los anillos que pasan por él no comparten sus vecinos:
+    # ahí empieza o termina un borde compartido.
+    vecinos = {}
+    uniones = set()
+    for anillo in anillos:
+        n = len(anillo)
+        for i, punto in enumerate(anillo):
+            par = frozenset((anillo[i - 1], anillo[(i + 1) % n]))
+            previo = vecinos.setdefault(punto, par)
+            if previo != par:
+                uniones.add(punto)
+    return uniones
+
+
+def _dividir_en_arcos(anillo, uniones):
+    cortes = [i for i, punto in enumerate(anillo) if punto in uniones]
+    if not cortes:
+        inicio = anillo.index(min(anillo))
+        girado = anillo[inicio:] + anillo[:inicio]
+        return [girado + [girado[0]]]
+    girado = anillo[cortes[0]:] + anillo[:cortes[0]]
+    cortes = [i - cortes[0] for i in cortes] + [len(anillo)]
+    girado.append(girado[0])
+    return [girado[a:b + 1] for a, b in zip(cortes[:-1], cortes[1:])]
+
+
+def _simplificar_arcos(arcos, anillos_por_arco, tolerancia):
+    if not tolerancia:
+        return arcos
+    simplificados = [_douglas_peucker(np.asarray(arco, dtype=float), tolerancia).astype(np.int64).tolist()
+                     if len(arco) > 2 else arco for arco in arcos]
+    # Un anillo que queda con menos de 4 vértices conserva sus arcos originales.
+    for indices in anillos_por_arco:
+        if sum(len(simplificados[i]) - 1 for i in indices) < 3:
+            for i in indices:
+                simplificados[i] = arcos[i]
+    return simplificados
+
+
+def construir_topologia(geojson, tolerancia=0.0, cuantizacion=100000, nombre='limites'):
+    coordenadas = np.concatenate([np.asarray(anillo, dtype=float)
+                                  for feature in geojson['features']
+                                  for poligono in _anillos(feature['geometry'])
+                                  for anillo in poligono])
+    origen = coordenadas.min(axis=0)
+    escala = np.maximum(coordenadas.max(axis=0) - origen, 1e-9) / (cuantizacion - 1)
+
+    cuantizados = [[[_cuantizar_anillo(anillo, origen, escala) for anillo in poligono]
+                    for poligono in _anillos(feature['geometry'])]
+                   for feature in geojson['features']]
+    uniones = _uniones([anillo for poligonos in cuantizados for poligono in poligonos
+                        for anillo in poligono if len(anillo) >= 3])
+
+    arcos = []
+    indice_arcos = {}
+    anillos_por_arco = []
+
+    def referencia(arco):
+        clave = tuple(arco)
+        if clave in indice_arcos:
+            return indice_arcos[clave]
+        inverso = clave[::-1]
+        if inverso in indice_arcos:
+            return ~indice_arcos[inverso]
+        indice_arcos[clave] = len(arcos)
+        arcos.append(arco)
+        return indice_arcos[clave]
+
+    geometrias = []
+    for feature, poligonos in zip(geojson['features'], cuantizados):
+        arcos_poligonos = []
+        for poligono in poligonos:
+            arcos_anillos = []
+            for anillo in poligono:
+                if len(anillo) < 3:
+                    continue
+                refs = [referencia(arco) for arco in _dividir_en_arcos(anillo, uniones)]
+                anillos_por_arco.append([r if r >= 0 else ~r for r in refs])
+                arcos_anillos.append(refs)
+            if arcos_anillos:
+                arcos_poligonos.append(arcos_anillos)
+        geometria = {'properties': feature['properties']}
+        if len(arcos_poligonos) == 1:
+            geometria.update(type='Polygon', arcs=arcos_poligonos[0])
+        elif arcos_poligonos:
+            geometria.update(type='MultiPolygon', arcs=arcos_poligonos)
+        else:
+            geometria['type'] = None
+        geometrias.append(geometria)
+
+    arcos = _simplificar_arcos(arcos, anillos_por_arco, tolerancia / escala.min())
+    codificados = []
+    for arco in arcos:
+        puntos = np.asarray(arco, dtype=np.int64)
+        puntos[1:] = np.diff(puntos, axis=0)
+        codificados.append(puntos.tolist())
+
+    return {
+        'type': 'Topology',
+        'transform': {'scale': escala.tolist(), 'translate': origen.tolist()},
+        'objects': {nombre: {'type': 'GeometryCollection', 'geometries': geometrias}},
+        'arcs': codificados,
+    }
+
+
+def ruta_topojson(nivel, tolerancia):
+    base = os.path.splitext(ARCHIVOS[nivel])[0]
+    return os.path.join(DIR_GEOJSON, 'simplificado', f'{base}_{tolerancia:g}.topojson')
+
+
+def cargar_topojson(nivel, tolerancia=None):
+    if tolerancia is None:
+        tolerancia = TOLERANCIA_POR_NIVEL[nivel]
+    return _cargar_topojson(nivel, float(tolerancia), _firma_origen(nivel))
+
+
+@lru_cache(maxsize=None)
+def _cargar_topojson(nivel, tolerancia, firma):
+    ruta = ruta_topojson(nivel, tolerancia)
+    with _lock_archivo(ruta):
+        if _vigente(ruta, firma):
+            return _leer_json(ruta)
+        topologia = construir_topologia(_cargar_geojson(nivel, 0.0, firma), tolerancia)
+        _guardar_derivado(topologia, ruta, firma or _firma_origen(nivel))
+        return topologia
+
+
+def preparar_geometrias(niveles=tuple(ARCHIVOS), tolerancias=TOLERANCIAS):
+    tamaños = {}
+    for nivel in niveles:
+        for tolerancia in tolerancias:
+            cargar_geojson(nivel, tolerancia)
+            cargar_topojson(nivel, tolerancia)
+            tamaños[(nivel, tolerancia)] = (os.path.getsize(ruta_geojson(nivel, tolerancia)),
+                                            os.path.getsize(ruta_topojson(nivel, tolerancia)))
+    return tamaños
+
+
+if __name__ == '__main__':
+    for (nivel, tolerancia), (geojson, topojson) in preparar_geometrias().items():
+        print(f'{nivel:<13} tolerancia={tolerancia:<7g} '
+              f'GeoJSON {geojson / 1024:>10,.1f} KB   TopoJSON {topojson / 1024:>10,.1f} KB')
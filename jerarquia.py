@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from perfil import log
+
+NIVELES_GEOGRAFICOS = ['departamento', 'provincia', 'distrito']
+
+
+def ruta_nivel(columna):
+    # Columnas que identifican una unidad de ese nivel: su nombre y el de sus superiores.
+    return NIVELES_GEOGRAFICOS[:NIVELES_GEOGRAFICOS.index(columna) + 1]
+
+
+class Jerarquia:
+    # Departamento -> provincia -> distrito, construida una vez al cargar el cubo. Cada
+    # distrito se identifica por su UBIGEO (DDPPdd, columna "ubigeo" de los casos) y su
+    # provincia y departamento por sus prefijos (DDPP, DD): los códigos no cambian al llegar
+    # datos nuevos, y dos provincias o distritos homónimos de distinto padre no se confunden.
+
+    def __init__(self, cubo):
+        codigos, filas = np.unique(cubo['ubigeo'].to_numpy(), return_inverse=True)
+        # Posición de la unidad (distrito) de cada fila del cubo.
+        self.filas = filas.astype(np.int32)
+
+        # Nombres de cada UBIGEO: los de la ruta con más casos si los datos traen variantes.
+        rutas = (cubo.assign(posicion=self.filas)
+                 .groupby(['posicion'] + NIVELES_GEOGRAFICOS, observed=True, sort=False)['casos'].sum()
+                 .reset_index().sort_values(['posicion', 'casos'], ascending=[True, False], kind='stable'))
+        variantes = rutas['posicion'].duplicated()
+        if variantes.any():
+            log.warning(f'{variantes.sum()} rutas de nombres comparten UBIGEO con otra: se muestran '
+                        f'con los nombres de la ruta con más casos')
+        unidades = rutas.loc[~variantes, NIVELES_GEOGRAFICOS].reset_index(drop=True)
+        for columna in NIVELES_GEOGRAFICOS:
+            unidades[columna] = unidades[columna].astype(str)
+        codigo = pd.Series([f'{codigo:06d}' for codigo in codigos])
+        unidades['codigo_departamento'] = codigo.str[:2]
+        unidades['codigo_provincia'] = codigo.str[:4]
+        unidades['codigo'] = codigo
+        self.unidades = unidades
+
+        provincias = unidades.drop_duplicates('codigo_provincia')
+        self._provincias = {}
+        for departamento, codigo in zip(provincias['departamento'], provincias['codigo_provincia']):
+            self._provincias.setdefault(departamento, []).append(codigo)
+        self._distritos = {}
+        for provincia, codigo in zip(unidades['codigo_provincia'], unidades['codigo']):
+            self._distritos.setdefault(provincia, []).append(codigo)
+
+        # Nombres; los homónimos se distinguen añadiendo el nombre del nivel superior.
+        self._nombres = {}
+        for codigos, nombres, padres in [
+                (provincias['codigo_provincia'], provincias['provincia'], provincias['departamento']),
+                (unidades['codigo'], unidades['distrito'], unidades['provincia'])]:
+            repetidos = nombres.duplicated(keep=False)
+            for codigo, nombre, padre, repetido in zip(codigos, nombres, padres, repetidos):
+                self._nombres[codigo] = f'{nombre} ({padre})' if repetido else nombre
+
+        # Valores que aceptan los filtros de provincias y distritos: nombres y códigos.
+        self._conocidos = {
+            'provincia': set(unidades['provincia']) | set(unidades['codigo_provincia']),
+            'distrito': set(unidades['distrito']) | set(unidades['codigo']),
+        }
+
+    def categorias_filas(self):
+        # Columna categórica con el código de distrito de cada fila del cubo.
+        return pd.Categorical.from_codes(self.filas, categories=self.unidades['codigo'])
+
+    def provincias(self, departamentos):
+        return [codigo for departamento in departamentos
+                for codigo in self._provincias.get(departamento, [])]
+
+    def distritos(self, provincias):
+        return [codigo for provincia in provincias for codigo in self._distritos.get(provincia, [])]
+
+    def nombre(self, codigo):
+        return self._nombres.get(codigo, codigo)
+
+    def desconocidos(self, valores, columna):
+        # Valores de un filtro de provincias o distritos que no nombran ninguna unidad.
+        return [valor for valor in valores if valor not in self._conocidos[columna]]
+
+    def _codigos(self, valores, columna_nombre, columna_codigo, departamentos):
+        # Acepta códigos o nombres; un nombre abarca sus homónimos dentro de los departamentos.
+        unidades = self.unidades[self.unidades['departamento'].isin(departamentos)]
+        por_codigo = unidades[columna_codigo].isin(valores)
+        por_nombre = unidades[columna_nombre].isin(valores)
+        return set(unidades.loc[por_codigo | por_nombre, columna_codigo])
+
+    def codigos_distrito(self, departamentos, provincias=(), distritos=()):
+        # Distritos seleccionados por la combinación de filtros geográficos, en códigos.
+        unidades = self.unidades[self.unidades['departamento'].isin(departamentos)]
+        if provincias:
+            codigos = self._codigos(provincias, 'provincia', 'codigo_provincia', departamentos)
+            unidades = unidades[unidades['codigo_provincia'].isin(codigos)]
+        if distritos:
+            codigos = self._codigos(distritos, 'distrito', 'codigo', departamentos)
+            unidades = unidades[unidades['codigo'].isin(codigos)]
+        return unidades['codigo'].tolist()
@@ -0,0 +1,210 @@
+import folium
+import numpy as np
+from folium.plugins import HeatMap
+
+ESTILO_POPUP = """
+<style>
+.leaflet-popup-content-wrapper, .leaflet-popup-tip {
+    background-color: #1E1E1E;
+    color: #E0E0E0;
+    border: 1px solid #333333;
+}
+.leaflet-popup-content {
+    font-family: Arial;
+    font-size: 14px;
+    width: 200px;
+}
+.leaflet-popup-content th {
+    font-weight: normal;
+    color: #E0E0E0;
+    text-align: left;
+    padding-right: 5px;
+}
+.leaflet-popup-content td {
+    font-weight: bold;
+    color: #FF5252;
+}
+.leaflet-popup-content tr:first-child td {
+    font-size: 16px;
+    color: #90CAF9;
+    border-bottom: 2px solid #FF5252;
+    padding-bottom: 5px;
+}
+</style>
+"""
+
+# Capitales de departamento: ahí se concentran los casos, mejor que el centroide del polígono.
+COORDENADAS_DEPARTAMENTOS = {
+    "LIMA": [-12.04318, -77.02824],
+    "CALLAO": [-12.05659, -77.11814],
+    "AREQUIPA": [-16.39889, -71.535],
+    "LA LIBERTAD": [-8.11599, -79.02998],
+    "LAMBAYEQUE": [-6.77137, -79.84088],
+    "PIURA": [-5.19449, -80.63282],
+    "JUNIN": [-12.06513, -75.20486],
+    "LORETO": [-3.74912, -73.25383],
+    "UCAYALI": [-8.37915, -74.55387],
+    "ANCASH": [-9.07508, -78.59373],
+    "TACNA": [-18.01465, -70.25362],
+    "ICA": [-14.06777, -75.72861],
+    "PUNO": [-15.8422, -70.0199],
+    "CUSCO": [-13.52264, -71.96734],
+    "CAJAMARCA": [-7.16378, -78.50027],
+    "HUANUCO": [-9.93062, -76.24223],
+    "SAN MARTIN": [-6.0, -76.0],
+    "AYACUCHO": [-13.15878, -74.22321],
+    "MADRE DE DIOS": [-12.59331, -69.18913]
+}
+
+# Lado de la celda (grados) al agregar casos para el mapa de calor; ~110 km por grado.
+TAMAÑO_CELDA = {
+    'Departamento': 1.0,
+    'Provincia': 0.5,
+    'Distrito': 0.25,
+}
+
+# Medidas que puede mostrar el mapa: columna de los agregados y texto del popup.
+MEDIDAS = {
+    'casos': 'Total de casos:',
+    'incidencia': 'Incidencia x 100 mil:',
+}
+
+ESTILO_TOOLTIP = "background-color: #2D2D2D; color: white; font-family: arial; font-size: L; padding: 10px;"
+
+
+def casos_por_feature(geometrias, casos_geo, indice, columna='casos'):
+    # Suma de `columna` (casos por defecto) por feature mediante el índice de unión (ruta de
+    # nombres -> posición del feature): una búsqueda por unidad, sin comparar cadenas por cada feature.
+    casos = [0] * len(geometrias)
+    rutas = casos_geo[indice.columnas].astype(str).itertuples(index=False, name=None)
+    for ruta, n in zip(rutas, casos_geo[columna].tolist()):
+        posicion = indice.feature_de.get(ruta)
+        if posicion is not None:
+            casos[posicion] += n
+    return casos
+
+
+def unir_casos(topologia, casos_geo, indice, total, objeto='limites', medida='casos'):
+    # Devuelve la topología con los textos del popup y {posición: valor de la medida}. La
+    # incidencia de un feature es la de sus casos sobre su población (ya en los agregados).
+    geometrias = topologia['objects'][objeto]['geometries']
+    por_feature = casos_por_feature(geometrias, casos_geo, indice)
+    # Sin población en los agregados no hay tasas: con medida 'incidencia' el mapa queda sin valores.
+    con_poblacion = 'poblacion' in casos_geo
+    incidencias = [None] * len(por_feature)
+    if con_poblacion:
+        poblacion = casos_por_feature(geometrias, casos_geo, indice, 'poblacion')
+        incidencias = [casos / habitantes * 100000 if casos and habitantes > 0 else None
+                       for casos, habitantes in zip(por_feature, poblacion)]
+
+    unidas = []
+    for posicion, (geometria, casos) in enumerate(zip(geometrias, por_feature)):
+        porcentaje = casos / total * 100 if total > 0 else 0.0
+        propiedades = {
+            **geometria['properties'],
+            'feature': posicion,
+            'casos': casos,
+            'casos_texto': f'{casos:,}',
+            'porcentaje_texto': f'{porcentaje:.1f}%',
+        }
+        if con_poblacion:
+            incidencia = incidencias[posicion]
+            propiedades['incidencia_texto'] = f'{incidencia:,.1f}' if incidencia is not None else 'N/D'
+        unidas.append({**geometria, 'properties': propiedades})
+    topologia_unida = {
+        **topologia,
+        'objects': {objeto: {'type': 'GeometryCollection', 'geometries': unidas}},
+    }
+    valores = incidencias if medida == 'incidencia' else por_feature
+    return topologia_unida, {posicion: valor for posicion, valor in enumerate(valores) if valor}
+
+
+def construir_mapa(topologia, casos_geo, indice, propiedad, nivel, total, leyenda, objeto='limites',
+                   medida='casos'):
+    m = folium.Map(
+        location=[-9.1900, -75.0152],
+        zoom_start=5,
+        tiles='CartoDB dark_matter'
+    )
+
+    topologia_unida, valores = unir_casos(topologia, casos_geo, indice, total, objeto, medida)
+    choropleth = folium.Choropleth(
+        geo_data=topologia_unida,
+        topojson=f'objects.{objeto}',
+        name='Casos de Dengue',
+        data=valores,
+        key_on='feature.properties.feature',
+        fill_color='YlOrRd',
+        fill_opacity=0.8,
+        line_opacity=0.3,
+        legend_name=leyenda
+    )
+    choropleth.add_to(m)
+
+    choropleth.geojson.add_child(folium.GeoJsonTooltip(
+        fields=[propiedad],
+        aliases=[f'{nivel}:'],
+        style=ESTILO_TOOLTIP
+    ))
+    campos = [propiedad, 'casos_texto', 'porcentaje_texto']
+    alias = ['', MEDIDAS['casos'], '% del total:']
+    if 'poblacion' in casos_geo:
+        campos.append('incidencia_texto')
+        alias.append(MEDIDAS['incidencia'])
+    choropleth.geojson.add_child(folium.GeoJsonPopup(
+        fields=campos,
+        aliases=alias,
+        max_width=300
+    ))
+    m.get_root().header.add_child(folium.Element(ESTILO_POPUP))
+    return m
+
+
+def agrupar_en_celdas(centros, pesos, tamaño_celda):
+    # Suma los casos de los centroides por celda de una grilla regular y devuelve el centro
+    # ponderado de cada celda con su peso relativo (0-1): el número de puntos depende de la
+    # grilla y no de la cantidad de casos.
+    centros = np.asarray(centros, dtype=float)
+    pesos = np.asarray(pesos, dtype=float)
+    validos = (pesos > 0) & np.isfinite(centros).all(axis=1)
+    centros, pesos = centros[validos], pesos[validos]
+    if not len(pesos):
+        return []
+    celdas = np.floor(centros / tamaño_celda).astype(np.int64)
+    _, grupo = np.unique(celdas, axis=0, return_inverse=True)
+    grupo = grupo.ravel()
+    total = np.bincount(grupo, weights=pesos)
+    lat = np.bincount(grupo, weights=centros[:, 0] * pesos) / total
+    lon = np.bincount(grupo, weights=centros[:, 1] * pesos) / total
+    return np.column_stack([lat.round(4), lon.round(4), (total / total.max()).round(3)]).tolist()
+
+
+def centros_mapa_calor(centros, indice, coordenadas=COORDENADAS_DEPARTAMENTOS):
+    if indice.columnas != ['departamento']:
+        return centros
+    centros = np.array(centros)
+    for (departamento,), posicion in indice.feature_de.items():
+        if departamento in coordenadas:
+            centros[posicion] = coordenadas[departamento]
+    return centros
+
+
+def construir_mapa_calor(centros, por_feature, nivel):
+    m = folium.Map(
+        location=[-9.1900, -75.0152],
+        zoom_start=5,
+        tiles='CartoDB dark_matter'
+    )
+    HeatMap(
+        agrupar_en_celdas(centros, por_feature, TAMAÑO_CELDA[nivel]),
+        name='Casos de Dengue',
+        radius=25 if nivel == 'Departamento' else 15,
+        blur=15,
+        min_opacity=0.3,
+        gradient={0.2: '#FFEDA0', 0.5: '#FD8D3C', 0.8: '#E31A1C', 1.0: '#800026'}
+    ).add_to(m)
+    return m
+
+
+def tamaño_html(m):
+    return len(m.get_root().render().encode('utf-8'))
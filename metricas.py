@@ -0,0 +1,436 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from cubo import sumar_por, total_casos
+from filtros import clave_estado
+from jerarquia import ruta_nivel
+from series import (AÑOS_CANAL, BANDAS_CANAL, bandas_endemicas, canal_endemico, matriz_año_semana,
+                    serie_continua)
+
+TODOS_LOS_AÑOS = 'Todos los años'
+TODOS = 'Todos'
+NIVELES = {
+    'Departamento': 'departamento',
+    'Provincia': 'provincia',
+    'Distrito': 'distrito',
+}
+POBLACION_ESTIMADA = 33000000
+MAX_TOP = 10
+# 'cuartiles' o 'media_geometrica' (ver series.bandas_endemicas).
+METODO_CANAL = os.environ.get('DENGUEAI_METODO_CANAL', 'cuartiles')
+# Longitud del prefijo del código de distrito (DDPPdd) que identifica a cada nivel.
+LONGITUD_CODIGO = {'departamento': 2, 'provincia': 4, 'distrito': 6}
+# Puntaje de riesgo: semanas de cada ventana, peso de cada componente, casos recientes
+# mínimos para entrar en el ranking y unidades mostradas.
+SEMANAS_RIESGO = 4
+PESOS_RIESGO = {'crecimiento': 0.35, 'exceso_basal': 0.4, 'aceleracion': 0.25}
+MIN_CASOS_RIESGO = int(os.environ.get('DENGUEAI_MIN_CASOS_RIESGO', '5'))
+MAX_RIESGO = 5
+
+FILTRO_POR_DEFECTO = {
+    'año': TODOS_LOS_AÑOS,
+    'año_comparado': None,
+    'nivel': 'Departamento',
+    'semanas': None,
+    'sexo': TODOS,
+    'tipo_edad': TODOS,
+    'departamentos': None,
+    'provincias': [],
+    'distritos': [],
+}
+
+Metricas = namedtuple('Metricas', [
+    'filtro', 'conteos', 'geo_column',
+    'casos_totales', 'casos_geo', 'top_geos', 'geo_max', 'casos_max', 'poblacion', 'incidencia', 'top_incidencia',
+    'año_comparado', 'casos_año_comparado', 'variacion_anual', 'deptos_afectados', 'total_deptos',
+    'casos_semana', 'casos_sexo', 'casos_edad', 'canal', 'riesgo',
+])
+
+CanalesUnidades = namedtuple('CanalesUnidades', ['posiciones', 'semanas', 'bandas'])
+
+
+def _año(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f'Año inválido: {valor}')
+
+
+def completar_filtro(filtro, cubo, jerarquia=None):
+    # Rellena los valores por defecto y valida el filtro; lanza ValueError si no es válido.
+    desconocidas = set(filtro) - set(FILTRO_POR_DEFECTO)
+    if desconocidas:
+        raise ValueError(f'Campos de filtro desconocidos: {", ".join(sorted(desconocidas))}')
+    filtro = {**FILTRO_POR_DEFECTO, **filtro}
+
+    if filtro['nivel'] not in NIVELES:
+        raise ValueError(f"Nivel geográfico inválido: {filtro['nivel']}")
+    if filtro['año'] == TODOS_LOS_AÑOS:
+        filtro['año_comparado'] = None
+    else:
+        filtro['año'] = _año(filtro['año'])
+        # Por defecto el año se compara con el anterior.
+        filtro['año_comparado'] = (filtro['año'] - 1 if filtro['año_comparado'] in (None, '')
+                                   else _año(filtro['año_comparado']))
+    if filtro['semanas'] is None:
+        filtro['semanas'] = (int(cubo['semana'].min()), int(cubo['semana'].max()))
+    else:
+        minimo, maximo = filtro['semanas']
+        filtro['semanas'] = (int(minimo), int(maximo))
+    for campo, columna in (('departamentos', 'departamento'), ('provincias', 'provincia'),
+                           ('distritos', 'distrito')):
+        valores = filtro[campo] or []
+        if isinstance(valores, str):
+            valores = [valores]
+        elif not isinstance(valores, (list, tuple)):
+            raise ValueError(f'{campo} debe ser una lista')
+        if jerarquia is not None and columna != 'departamento':
+            desconocidos = jerarquia.desconocidos(valores, columna)
+        else:
+            desconocidos = [valor for valor in valores if valor not in cubo[columna].cat.categories]
+        if desconocidos:
+            raise ValueError(f'Valores desconocidos en {campo}: {", ".join(map(str, desconocidos))}')
+        filtro[campo] = list(valores)
+    if not filtro['departamentos']:
+        filtro['departamentos'] = cubo['departamento'].cat.categories.tolist()
+    return filtro
+
+
+def predicados(filtro, jerarquia=None):
+    nivel = filtro['nivel']
+    rangos = {'semana': filtro['semanas']}
+    if filtro['año'] != TODOS_LOS_AÑOS:
+        rangos['ano'] = (filtro['año'], filtro['año'])
+
+    valores = {'departamento': filtro['departamentos']}
+    if filtro['sexo'] != TODOS:
+        valores['sexo'] = [filtro['sexo']]
+    if filtro['tipo_edad'] != TODOS:
+        valores['tipo_edad'] = [filtro['tipo_edad']]
+    provincias = filtro['provincias'] if nivel in ['Provincia', 'Distrito'] else []
+    distritos = filtro['distritos'] if nivel == 'Distrito' else []
+    if jerarquia is not None and (provincias or distritos):
+        # Provincias y distritos por código (o nombre) dentro de sus departamentos.
+        valores['unidad'] = jerarquia.codigos_distrito(filtro['departamentos'], provincias, distritos)
+    else:
+        if provincias:
+            valores['provincia'] = provincias
+        if distritos:
+            valores['distrito'] = distritos
+    return rangos, valores
+
+
+def casos_por_año_semana(motor, valores):
+    # Casos por (año, semana) para unos filtros de sexo, edad y geografía. Se calcula una
+    # vez por combinación de esos filtros; después el total de cualquier año y rango de
+    # semanas es una búsqueda en una tabla de a lo sumo años x 53 filas.
+    clave = clave_estado(motor.normalizar(valores=valores))
+    return motor.agregado(('año_semana', clave), lambda: sumar_por(
+        motor.tabla.take(motor.seleccionar(valores=valores).filas), ['ano', 'semana']))
+
+
+def casos_en_periodo(indice, año, semanas):
+    dentro = (indice['ano'] == año) & indice['semana'].between(*semanas)
+    return int(indice.loc[dentro, 'casos'].sum())
+
+
+def conteos_por_unidad(motor, columna, filas, desde, hasta):
+    # Casos (unidades del nivel x años desde..hasta-1 x semanas) de las filas dadas del cubo,
+    # con un solo bincount. Devuelve los códigos de las unidades y la matriz.
+    tabla = motor.tabla
+    prefijos = tabla['unidad'].cat.categories.str[:LONGITUD_CODIGO[columna]]
+    unidad_de_categoria, codigos = pd.factorize(prefijos)
+    n_años, n_semanas = hasta - desde, int(tabla['semana'].max())
+    anos = tabla['ano'].to_numpy()[filas]
+    en_ventana = (anos >= desde) & (anos < hasta)
+    filas = filas[en_ventana]
+    unidad = unidad_de_categoria[tabla['unidad'].cat.codes.to_numpy()[filas]]
+    plano = (unidad * n_años + anos[en_ventana] - desde) * n_semanas + tabla['semana'].to_numpy()[filas] - 1
+    # Sin filas en la ventana bincount devuelve enteros: siempre float, para poder marcar NaN.
+    conteos = np.bincount(plano, weights=tabla['casos'].to_numpy()[filas],
+                          minlength=len(codigos) * n_años * n_semanas).astype(float, copy=False)
+    return codigos, conteos.reshape(len(codigos), n_años, n_semanas)
+
+
+def _años_sin_datos(motor, desde, hasta):
+    # Un año sin ningún registro en el cubo es un año sin datos, no un año sin casos.
+    return ~np.isin(np.arange(desde, hasta), motor.tabla['ano'].unique())
+
+
+def canales_por_unidad(motor, columna, año, metodo=METODO_CANAL):
+    # Canal endémico de `año` para todas las unidades del nivel en una pasada: conteos
+    # (unidades x años previos x semanas) con bincount y bandas vectorizadas. Se memoriza en
+    # el motor, así cada vista de una sola unidad es una búsqueda.
+    def construir():
+        desde = año - AÑOS_CANAL
+        codigos, conteos = conteos_por_unidad(motor, columna, np.arange(motor.n_filas), desde, año)
+        conteos[:, _años_sin_datos(motor, desde, año), :] = np.nan
+        posiciones = {codigo: i for i, codigo in enumerate(codigos)}
+        semanas = np.arange(1, conteos.shape[-1] + 1)
+        return CanalesUnidades(posiciones, semanas, bandas_endemicas(conteos, metodo))
+
+    return motor.agregado(('canal_unidades', columna, año, metodo), construir)
+
+
+def _saturar(valores):
+    # [0, inf) -> [0, 1): 0 sin aumento, ~0.63 al duplicar, ~0.86 al triplicar.
+    return 1 - np.exp(-np.clip(valores, 0, None))
+
+
+def _nombres_unidades(jerarquia, columna, codigos):
+    if columna == 'departamento':
+        unidades = jerarquia.unidades.drop_duplicates('codigo_departamento')
+        nombres = dict(zip(unidades['codigo_departamento'], unidades['departamento']))
+        return [nombres[codigo] for codigo in codigos]
+    return [jerarquia.nombre(codigo) for codigo in codigos]
+
+
+def riesgo_por_unidad(motor, columna, valores, año, semana):
+    # Puntaje de riesgo (0-100) de todas las unidades del nivel en la semana `semana` de `año`,
+    # a partir de sus casos semanales con los filtros de sexo, edad y geografía de la vista:
+    # - crecimiento: casos de las últimas SEMANAS_RIESGO semanas frente a las anteriores;
+    # - exceso basal: casos recientes frente a la media de esas semanas en los años previos;
+    # - aceleración: cambio de la pendiente semanal entre ambas ventanas, relativo al nivel.
+    # Todo en matrices (unidades x semanas); se memoriza en el motor por estado de filtros.
+    def construir():
+        desde = año - AÑOS_CANAL
+        filas = motor.seleccionar(valores=valores).filas
+        codigos, conteos = conteos_por_unidad(motor, columna, filas, desde, año + 1)
+        n_semanas = conteos.shape[-1]
+        # Serie continua por unidad, con ceros delante para que las ventanas del año más
+        # antiguo no se salgan del inicio.
+        serie = np.pad(conteos.reshape(len(codigos), -1), ((0, 0), (2 * SEMANAS_RIESGO, 0)))
+        fin = 2 * SEMANAS_RIESGO + AÑOS_CANAL * n_semanas + semana
+
+        def ventana(final):
+            return serie[:, final - SEMANAS_RIESGO:final]
+
+        recientes, previos = ventana(fin), ventana(fin - SEMANAS_RIESGO)
+        casos_recientes, casos_previos = recientes.sum(axis=1), previos.sum(axis=1)
+        # Años previos del más reciente al más antiguo; solo cuentan los que tienen datos.
+        con_datos = ~_años_sin_datos(motor, desde, año)[::-1]
+        historicos = [ventana(fin - k * n_semanas).sum(axis=1)
+                      for k in range(1, AÑOS_CANAL + 1) if con_datos[k - 1]]
+        basal = np.mean(historicos, axis=0) if historicos else casos_recientes
+        # Pendiente por mínimos cuadrados de cada ventana: ventana @ pesos.
+        x = np.arange(SEMANAS_RIESGO) - (SEMANAS_RIESGO - 1) / 2
+        pesos = x / (x ** 2).sum()
+
+        riesgo = pd.DataFrame({
+            'codigo': codigos,
+            columna: _nombres_unidades(motor.jerarquia, columna, codigos),
+            'casos_recientes': casos_recientes.astype(np.int64),
+            'crecimiento': (casos_recientes + 1) / (casos_previos + 1) - 1,
+            'exceso_basal': (casos_recientes + 1) / (basal + 1) - 1,
+            'aceleracion': (recientes @ pesos - previos @ pesos) / (casos_recientes / SEMANAS_RIESGO + 1),
+        })
+        puntaje = sum(peso * _saturar(riesgo[componente].to_numpy())
+                      for componente, peso in PESOS_RIESGO.items())
+        riesgo['puntaje_riesgo'] = (100 * puntaje).round(1)
+        return riesgo
+
+    clave = clave_estado(motor.normalizar(valores=valores))
+    return motor.agregado(('riesgo', columna, clave, año, semana), construir)
+
+
+def riesgo_vista(motor, filtro, valores):
+    # Unidades de mayor riesgo de la vista, a la última semana con casos de su periodo.
+    vacio = pd.DataFrame(columns=['codigo', NIVELES[filtro['nivel']], 'casos_recientes',
+                                  *PESOS_RIESGO, 'puntaje_riesgo'])
+    indice = casos_por_año_semana(motor, valores)
+    indice = indice[indice['casos'] > 0]
+    if indice.empty:
+        # Selección sin casos en ningún año: no hay año ni semana de referencia.
+        return vacio
+    año = int(indice['ano'].max()) if filtro['año'] == TODOS_LOS_AÑOS else filtro['año']
+    con_casos = indice[(indice['ano'] == año) & indice['semana'].between(*filtro['semanas'])]
+    if con_casos.empty:
+        return vacio
+    riesgo = riesgo_por_unidad(motor, NIVELES[filtro['nivel']], valores, año, int(con_casos['semana'].max()))
+    riesgo = riesgo[riesgo['casos_recientes'] >= MIN_CASOS_RIESGO]
+    return riesgo.sort_values(['puntaje_riesgo', 'casos_recientes'], ascending=False).head(MAX_RIESGO)
+
+
+def unidad_de_seleccion(motor, valores, columna):
+    # Código de la unidad de nivel `columna` si la selección geográfica es exactamente esa
+    # unidad, sin filtros de sexo ni edad; None en otro caso.
+    if motor.jerarquia is None or set(valores) - {'departamento', 'unidad'}:
+        return None
+    unidades = motor.jerarquia.unidades
+    if 'unidad' in valores:
+        seleccion = unidades['codigo'][unidades['codigo'].isin(valores['unidad'])]
+    else:
+        seleccion = unidades['codigo'][unidades['departamento'].isin(valores['departamento'])]
+    prefijos = seleccion.str[:LONGITUD_CODIGO[columna]].unique()
+    if len(prefijos) != 1 or unidades['codigo'].str.startswith(prefijos[0]).sum() != len(seleccion):
+        return None
+    return prefijos[0]
+
+
+def _unidad_unica(motor, filtro, valores):
+    # (columna, código) si la vista es exactamente una unidad de su nivel: su canal sale del
+    # cálculo por lotes.
+    columna = NIVELES[filtro['nivel']]
+    codigo = unidad_de_seleccion(motor, valores, columna)
+    return (columna, codigo) if codigo is not None else None
+
+
+def canal_vista(motor, filtro, valores, metodo=METODO_CANAL):
+    # Bandas del canal endémico (por año y semana) para los años y semanas de la vista.
+    unidad = _unidad_unica(motor, filtro, valores)
+    if unidad is not None and filtro['año'] != TODOS_LOS_AÑOS:
+        columna, codigo = unidad
+        canales = canales_por_unidad(motor, columna, filtro['año'], metodo)
+        bandas = canales.bandas[canales.posiciones[codigo]] if codigo in canales.posiciones else None
+        años, semanas = np.array([filtro['año']]), canales.semanas
+        if bandas is not None:
+            bandas = bandas[None]
+    else:
+        # Años sin casos de la selección cuentan como 0 en su historia, igual que por lotes.
+        rango_años = (int(motor.tabla['ano'].min()), int(motor.tabla['ano'].max()))
+        años, semanas, matriz = matriz_año_semana(
+            serie_continua(casos_por_año_semana(motor, valores), rango_años))
+        bandas = canal_endemico(matriz, metodo) if len(años) else None
+    if bandas is None:
+        return pd.DataFrame(columns=['ano', 'semana'] + BANDAS_CANAL)
+
+    canal = pd.DataFrame({'ano': np.repeat(años, len(semanas)), 'semana': np.tile(semanas, len(años))})
+    for i, banda in enumerate(BANDAS_CANAL):
+        canal[banda] = bandas[:, i, :].ravel()
+    dentro = canal['semana'].between(*filtro['semanas'])
+    if filtro['año'] != TODOS_LOS_AÑOS:
+        dentro &= canal['ano'] == filtro['año']
+    return canal[dentro].dropna().reset_index(drop=True)
+
+
+def años_vista(motor, filtro):
+    if filtro['año'] != TODOS_LOS_AÑOS:
+        return [filtro['año']]
+    return motor.agregado(('años',), lambda: np.sort(motor.tabla['ano'].unique()))
+
+
+def poblacion_vista(motor, valores, años):
+    # Población de los distritos de la geografía de la vista (con o sin casos); no distingue
+    # sexo ni edad, así que con esos filtros la tasa es sobre la población total.
+    unidades = motor.jerarquia.unidades
+    if 'unidad' in valores:
+        codigos = valores['unidad']
+    else:
+        codigos = unidades.loc[unidades['departamento'].isin(valores['departamento']), 'codigo']
+    return motor.poblacion.total(codigos, años)
+
+
+def estado_vista(motor, filtro):
+    # Estado normalizado que identifica la vista (se usa como clave de las figuras).
+    return {
+        'nivel': filtro['nivel'],
+        'año': str(filtro['año']),
+        **motor.normalizar(*predicados(filtro, motor.jerarquia)),
+    }
+
+
+def calcular_metricas(motor, filtro):
+    # Solo devuelve agregados: el resultado puede quedar guardado por sesión (argumentos de
+    # los fragmentos) sin copiar filas del cubo compartido.
+    cubo = motor.tabla
+    filtro = completar_filtro(filtro, cubo, motor.jerarquia)
+    rangos, valores = predicados(filtro, motor.jerarquia)
+    seleccion = motor.seleccionar(rangos, valores)
+    cubo_filtrado = cubo.take(seleccion.filas)
+    geo_column = NIVELES[filtro['nivel']]
+
+    casos_totales = total_casos(cubo_filtrado)
+    # Con los niveles superiores: provincias o distritos homónimos quedan separados.
+    casos_geo = sumar_por(cubo_filtrado, ruta_nivel(geo_column))
+    # Con tabla de población, la tasa por 100 000 hab. queda junto a los casos de cada unidad:
+    # el mapa, el top y los KPI cambian entre casos y tasas sin volver a agrupar.
+    poblacion, top_incidencia = POBLACION_ESTIMADA, None
+    if motor.poblacion is not None:
+        años = años_vista(motor, filtro)
+        casos_geo['poblacion'] = motor.poblacion.de_unidades(casos_geo, geo_column, años)
+        casos_geo['incidencia'] = casos_geo['casos'] / casos_geo['poblacion'] * 100000
+        top_incidencia = casos_geo.sort_values('incidencia', ascending=False).head(MAX_TOP).dropna()
+        poblacion = poblacion_vista(motor, valores, años)
+    incidencia = casos_totales / poblacion * 100000 if poblacion > 0 else None
+
+    top_geos = casos_geo.sort_values('casos', ascending=False).head(MAX_TOP)
+    if casos_geo.empty:
+        geo_max, casos_max = 'N/A', 0
+    else:
+        fila_max = casos_geo.loc[casos_geo['casos'].idxmax()]
+        geo_max, casos_max = str(fila_max[geo_column]), int(fila_max['casos'])
+
+    casos_año_comparado = variacion_anual = None
+    if filtro['año_comparado'] is not None:
+        # Mismas semanas, sexo, edad y geografía que la vista actual.
+        indice = casos_por_año_semana(motor, valores)
+        casos_año_comparado = casos_en_periodo(indice, filtro['año_comparado'], filtro['semanas'])
+        if casos_año_comparado > 0:
+            variacion_anual = (casos_totales - casos_año_comparado) / casos_año_comparado * 100
+
+    return Metricas(
+        filtro=filtro,
+        conteos=seleccion.conteos,
+        geo_column=geo_column,
+        casos_totales=casos_totales,
+        casos_geo=casos_geo,
+        top_geos=top_geos,
+        geo_max=geo_max,
+        casos_max=casos_max,
+        poblacion=poblacion,
+        incidencia=incidencia,
+        top_incidencia=top_incidencia,
+        año_comparado=filtro['año_comparado'],
+        casos_año_comparado=casos_año_comparado,
+        variacion_anual=variacion_anual,
+        deptos_afectados=cubo_filtrado['departamento'].nunique(),
+        total_deptos=len(cubo['departamento'].cat.categories),
+        casos_semana=sumar_por(cubo_filtrado, ['ano', 'semana']),
+        casos_sexo=sumar_por(cubo_filtrado, 'sexo'),
+        casos_edad=sumar_por(cubo_filtrado, 'tipo_edad'),
+        canal=canal_vista(motor, filtro, valores),
+        riesgo=riesgo_vista(motor, filtro, valores),
+    )
+
+
+def _registros(tabla):
+    def valores(serie):
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            return serie.astype(str).tolist()
+        if pd.api.types.is_float_dtype(serie.dtype):
+            # NaN (p. ej. unidades sin población) como null en el JSON.
+            return serie.round(2).astype(object).where(serie.notna(), None).tolist()
+        if pd.api.types.is_string_dtype(serie.dtype):
+            return serie.tolist()
+        return serie.astype('int64').tolist()
+
+    columnas = {columna: valores(tabla[columna]) for columna in tabla.columns}
+    return [dict(zip(columnas, fila)) for fila in zip(*columnas.values())]
+
+
+def metricas_a_dict(metricas):
+    return {
+        'filtro': metricas.filtro,
+        'kpis': {
+            'casos_totales': metricas.casos_totales,
+            'geo_max': metricas.geo_max,
+            'casos_max': metricas.casos_max,
+            'poblacion': metricas.poblacion,
+            'incidencia_100k': metricas.incidencia,
+            'año_comparado': metricas.año_comparado,
+            'casos_año_comparado': metricas.casos_año_comparado,
+            'variacion_anual': metricas.variacion_anual,
+            'deptos_afectados': metricas.deptos_afectados,
+            'total_deptos': metricas.total_deptos,
+        },
+        'celdas': dict(metricas.conteos),
+        'casos_geo': _registros(metricas.casos_geo),
+        'casos_semana': _registros(metricas.casos_semana),
+        'casos_sexo': _registros(metricas.casos_sexo),
+        'casos_edad': _registros(metricas.casos_edad),
+        'canal_endemico': _registros(metricas.canal),
+        'riesgo': _registros(metricas.riesgo),
+    }
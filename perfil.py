@@ -0,0 +1,59 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger('dengueai.rendimiento')
+if not log.handlers:
+    _manejador = logging.StreamHandler()
+    _manejador.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+    log.addHandler(_manejador)
+    log.setLevel(os.environ.get('DENGUEAI_LOG_NIVEL', 'INFO').upper())
+    log.propagate = False
+
+
+class Medicion:
+
+    def __init__(self):
+        self.inicio = self._ultima = time.perf_counter()
+        self.etapas = {}
+        self.estado = None
+
+    def marca(self, nombre):
+        # Atribuye a `nombre` el tiempo transcurrido desde la marca anterior.
+        ahora = time.perf_counter()
+        self.etapas[nombre] = self.etapas.get(nombre, 0.0) + ahora - self._ultima
+        self._ultima = ahora
+
+    def total(self):
+        return time.perf_counter() - self.inicio
+
+    def registrar(self, evento='rerun'):
+        # Una línea JSON por rerun, fácil de filtrar y agregar desde los logs del servidor.
+        log.info(json.dumps({
+            'evento': evento,
+            'total_ms': round(self.total() * 1000, 1),
+            'etapas_ms': {nombre: round(segundos * 1000, 1) for nombre, segundos in self.etapas.items()},
+            'filtro': self.estado,
+        }, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def perfilar(activo, lineas=40):
+    resultado = {}
+    if not activo:
+        yield resultado
+        return
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield resultado
+    finally:
+        perfil.disable()
+        salida = io.StringIO()
+        pstats.Stats(perfil, stream=salida).sort_stats('cumulative').print_stats(lineas)
+        resultado['texto'] = salida.getvalue()
@@ -0,0 +1,149 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from jerarquia import NIVELES_GEOGRAFICOS, ruta_nivel
+from perfil import log
+from union_geo import normalizar_nombre
+
+# Población por distrito y año: departamento, provincia, distrito, ano, poblacion.
+RUTA_POBLACION = os.environ.get('DENGUEAI_POBLACION', 'poblacion.csv')
+COLUMNAS_POBLACION = NIVELES_GEOGRAFICOS + ['ano', 'poblacion']
+
+
+def cargar_tabla_poblacion(ruta=RUTA_POBLACION):
+    # Sin archivo el dashboard sigue funcionando, solo con casos (sin tasas por unidad).
+    if not os.path.exists(ruta):
+        log.info(f'Sin tabla de población ({ruta}): no se calcularán tasas por unidad')
+        return None
+    tabla = pd.read_csv(ruta)
+    faltantes = [columna for columna in COLUMNAS_POBLACION if columna not in tabla.columns]
+    if faltantes:
+        raise ValueError(f'A la tabla de población le faltan columnas: {", ".join(faltantes)}')
+    return tabla[COLUMNAS_POBLACION]
+
+
+def _claves(rutas):
+    # Clave de cada fila para cada nivel: su ruta de nombres normalizados hasta ese nivel.
+    claves, clave = {}, None
+    for columna in NIVELES_GEOGRAFICOS:
+        # Cada nombre distinto se normaliza una sola vez.
+        nombres = rutas[columna].astype(str)
+        nombres = nombres.map({nombre: normalizar_nombre(nombre) for nombre in nombres.unique()})
+        clave = nombres if clave is None else clave + '/' + nombres
+        claves[columna] = clave.to_numpy()
+    return claves
+
+
+class Poblacion:
+    # Población por distrito y año de la propia tabla de población (tengan o no casos los
+    # distritos), unida una vez por nombre normalizado a la jerarquía de los casos al cargar
+    # los datos, y sus sumas por provincia y departamento. Un año sin dato de un distrito
+    # toma el del año más cercano.
+
+    def __init__(self, tabla, jerarquia):
+        self.jerarquia = jerarquia
+        self.años = np.sort(tabla['ano'].unique()).astype(int)
+
+        # Un distrito por ruta normalizada; las variantes de escritura de un mismo distrito se suman.
+        rutas = tabla[NIVELES_GEOGRAFICOS].drop_duplicates().reset_index(drop=True)
+        claves = _claves(rutas)
+        unicas = ~pd.Series(claves['distrito']).duplicated().to_numpy()
+        self._claves = {columna: valores[unicas] for columna, valores in claves.items()}
+        posicion = pd.Series(np.arange(unicas.sum()), index=self._claves['distrito'])
+        rutas['posicion'] = posicion.reindex(claves['distrito']).to_numpy()
+        matriz = (tabla.merge(rutas, on=NIVELES_GEOGRAFICOS)
+                  .groupby(['posicion', 'ano'])['poblacion'].sum()
+                  .unstack('ano').reindex(index=range(len(posicion)), columns=self.años))
+        rutas = rutas[unicas]
+        self.por_distrito = matriz.ffill(axis=1).bfill(axis=1).to_numpy(dtype=float)
+        self.por_distrito.flags.writeable = False
+
+        # Por nivel: grupo (unidad de ese nivel) de cada distrito de los casos y de la tabla
+        # (-1 si no está en los casos), para sumar en total() las unidades completas.
+        unidades = jerarquia.unidades
+        self._claves_unidades = _claves(unidades[NIVELES_GEOGRAFICOS])
+        self._codigos = pd.Index(unidades['codigo'].to_numpy(dtype=object))
+        self._grupos = {}
+        for columna in NIVELES_GEOGRAFICOS:
+            grupo_unidad, claves_grupo = pd.factorize(self._claves_unidades[columna])
+            grupo_tabla = pd.Index(claves_grupo).get_indexer(self._claves[columna])
+            self._grupos[columna] = (grupo_unidad, grupo_tabla, np.bincount(grupo_unidad))
+
+        # Distritos de los casos sin población y distritos de la población sin casos.
+        grupo_unidad, grupo_tabla, _ = self._grupos['distrito']
+        con_dato = grupo_tabla[(grupo_tabla >= 0) & ~np.isnan(self.por_distrito).all(axis=1)]
+        con_poblacion = np.isin(grupo_unidad, con_dato)
+        self.sin_poblacion = unidades.loc[~con_poblacion, NIVELES_GEOGRAFICOS + ['codigo']]
+        if len(self.sin_poblacion):
+            log.warning(f'{len(self.sin_poblacion)} distritos sin población: no tendrán tasa de incidencia')
+        self.sin_unidad = rutas.loc[grupo_tabla < 0, NIVELES_GEOGRAFICOS]
+
+        # Por nivel: población de cada unidad de los casos, con índice con su ruta de nombres
+        # (como en los agregados del cubo) x años; suma todos los distritos de la tabla.
+        self._niveles = {}
+        for columna in NIVELES_GEOGRAFICOS:
+            sumas = (pd.DataFrame(self.por_distrito, columns=self.años)
+                     .groupby(self._claves[columna]).sum(min_count=1))
+            unicas = ~unidades.duplicated(ruta_nivel(columna)).to_numpy()
+            por_nivel = sumas.reindex(self._claves_unidades[columna][unicas])
+            por_nivel.index = pd.MultiIndex.from_frame(unidades.loc[unicas, ruta_nivel(columna)])
+            self._niveles[columna] = por_nivel
+
+    def _columnas_años(self, años):
+        # Posición del año disponible más cercano a cada año pedido.
+        años = np.asarray(años)
+        return np.abs(self.años[None, :] - años[:, None]).argmin(axis=1)
+
+    def de_unidades(self, agregado, columna, años):
+        # Población media en `años` de cada fila de un agregado por ruta_nivel(columna).
+        por_nivel = self._niveles[columna].iloc[:, self._columnas_años(años)].mean(axis=1, skipna=False)
+        rutas = pd.MultiIndex.from_frame(agregado[ruta_nivel(columna)].astype(str))
+        return por_nivel.reindex(rutas).to_numpy()
+
+    def total(self, codigos, años):
+        # Población media en `años` de la geografía que cubren unos distritos de los casos (por
+        # código): un departamento o provincia con todos sus distritos seleccionados suma
+        # también los distritos de la tabla sin casos. Los distritos sin dato no suman.
+        posiciones = self._codigos.get_indexer(list(codigos))
+        seleccionados = np.zeros(len(self._codigos), dtype=bool)
+        seleccionados[posiciones[posiciones >= 0]] = True
+        # Con todos los distritos de los casos la geografía es el país: también cuentan los
+        # departamentos sin casos.
+        filas = np.full(len(self.por_distrito), seleccionados.all())
+        cubiertos = np.zeros(len(seleccionados), dtype=bool)
+        for columna in NIVELES_GEOGRAFICOS:
+            grupo_unidad, grupo_tabla, tamaños = self._grupos[columna]
+            completos = (np.bincount(grupo_unidad[seleccionados], minlength=len(tamaños)) == tamaños)[grupo_unidad]
+            completos &= seleccionados
+            nuevos = np.zeros(len(tamaños), dtype=bool)
+            nuevos[grupo_unidad[completos & ~cubiertos]] = True
+            filas |= (grupo_tabla >= 0) & nuevos[grupo_tabla]
+            cubiertos |= completos
+        return float(np.nansum(self.por_distrito[np.ix_(filas, self._columnas_años(años))], axis=0).mean())
+
+    def memoria_bytes(self):
+        claves = list(self._claves.values()) + list(self._claves_unidades.values())
+        return (self.por_distrito.nbytes + sum(int(pd.Series(c).memory_usage(deep=True)) for c in claves)
+                + sum(int(por_nivel.memory_usage(deep=True).sum()) for por_nivel in self._niveles.values()))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from carga_datos import RUTA_CSV
+    from datos_compartidos import DatosCompartidos
+
+    parser = argparse.ArgumentParser(description='Reporte de unidades de los casos sin población y viceversa')
+    parser.add_argument('ruta', nargs='?', default=RUTA_CSV)
+    args = parser.parse_args()
+
+    poblacion = DatosCompartidos(args.ruta).obtener().poblacion
+    if poblacion is None:
+        raise SystemExit(f'No se encontró la tabla de población ({RUTA_POBLACION})')
+    print(f'Años con población: {", ".join(map(str, poblacion.años))}')
+    print(f'{len(poblacion.sin_poblacion)} distritos de los casos sin población, '
+          f'{len(poblacion.sin_unidad)} distritos de la población sin casos')
+    for ruta in poblacion.sin_poblacion[NIVELES_GEOGRAFICOS].itertuples(index=False, name=None):
+        print(f'  sin población: {" / ".join(ruta)}')
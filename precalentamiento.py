@@ -0,0 +1,118 @@
+import os
+import threading
+from collections import namedtuple
+
+import requests
+
+from datos_compartidos import datos as datos_por_defecto
+from figuras import (cache_figuras, claves_paneles, figura_cacheada, figura_edad, figura_evolucion,
+                     figura_factores, figura_riesgo, figura_sexo, figura_top_geos)
+from geometrias import cargar_topojson, centroides
+from metricas import (FILTRO_POR_DEFECTO, NIVELES, TODOS_LOS_AÑOS, calcular_metricas, canales_por_unidad,
+                      estado_vista)
+from perfil import Medicion, log
+from pronostico import pronostico_vista
+from union_geo import indice_union
+
+# Con 0 el dashboard no precalienta al arrancar (p. ej. si ya se ejecutó la CLI en el despliegue).
+PRECALENTAR = os.environ.get('DENGUEAI_PRECALENTAR', '1') != '0'
+NIVEL_PRECALENTADO = 'Departamento'
+
+Precalentamiento = namedtuple('Precalentamiento', ['segundos', 'etapas', 'vistas', 'figuras'])
+
+
+def vistas_por_defecto(motor, nivel=NIVEL_PRECALENTADO):
+    # La vista inicial del dashboard y la de cada año por separado, en el mismo nivel.
+    años = [str(año) for año in sorted(motor.tabla['ano'].unique())]
+    return [{**FILTRO_POR_DEFECTO, 'año': año, 'nivel': nivel} for año in [TODOS_LOS_AÑOS] + años]
+
+
+def preparar_figuras(metricas, claves, pronostico=None):
+    # Construye las figuras de la vista con los mismos nombres y claves que usan los paneles
+    # del dashboard, de modo que su primer render sea un acierto de la cache.
+    nivel, etiqueta_año = metricas.filtro['nivel'], str(metricas.filtro['año'])
+    if metricas.casos_geo.empty:
+        return
+    figura_cacheada('top_geos', claves['top_geos'], lambda: figura_top_geos(
+        metricas.top_geos, metricas.geo_column, nivel, etiqueta_año))
+    figura_cacheada('evolucion', claves['evolucion'],
+                    lambda: figura_evolucion(metricas.casos_semana, etiqueta_año, metricas.canal, pronostico))
+    figura_cacheada('sexo', claves['demografia'], lambda: figura_sexo(metricas.casos_sexo))
+    figura_cacheada('edad', claves['demografia'], lambda: figura_edad(metricas.casos_edad))
+    if not metricas.riesgo.empty:
+        figura_cacheada('riesgo', claves['riesgo'], lambda: figura_riesgo(metricas.riesgo, metricas.geo_column))
+    figura_cacheada('factores', claves['factores'], figura_factores)
+
+
+def precalentar(datos=datos_por_defecto, nivel=NIVEL_PRECALENTADO):
+    medicion = Medicion()
+    motor = datos.obtener()
+    medicion.marca('carga_datos')
+
+    try:
+        indice_union(motor, NIVELES[nivel], cargar_topojson(nivel))
+        centroides(nivel)
+    except (OSError, ValueError, requests.RequestException) as e:
+        # Sin límites el dashboard sigue funcionando; se reintentará en la primera visita.
+        log.warning(f'Precalentamiento: no se pudieron cargar los límites de {nivel}: {e}')
+    medicion.marca('limites')
+
+    # Canal endémico del último año para todas las unidades de cada nivel, por lotes.
+    ultimo_año = int(motor.tabla['ano'].max())
+    for columna in NIVELES.values():
+        canales_por_unidad(motor, columna, ultimo_año)
+    medicion.marca('canales')
+
+    vistas = vistas_por_defecto(motor, nivel)
+    figuras_antes = len(cache_figuras)
+    for filtro in vistas:
+        metricas = calcular_metricas(motor, filtro)
+        preparar_figuras(metricas, claves_paneles(estado_vista(motor, metricas.filtro)),
+                         pronostico_vista(motor, metricas.filtro))
+    medicion.marca('vistas')
+
+    medicion.estado = {'nivel': nivel, 'vistas': len(vistas)}
+    medicion.registrar('precalentamiento')
+    return Precalentamiento(medicion.total(), medicion.etapas, len(vistas), len(cache_figuras) - figuras_antes)
+
+
+_iniciado = threading.Event()
+_lock_inicio = threading.Lock()
+
+
+def precalentar_en_segundo_plano(datos=datos_por_defecto):
+    # Una sola vez por proceso: la primera sesión lanza el precalentamiento y sigue con su
+    # propio render, que comparte la carga de datos gracias al lock de DatosCompartidos.
+    with _lock_inicio:
+        if _iniciado.is_set():
+            return None
+        _iniciado.set()
+
+    def ejecutar():
+        try:
+            precalentar(datos)
+        except Exception as e:
+            log.warning(f'Precalentamiento fallido: {e}')
+
+    hilo = threading.Thread(target=ejecutar, name='precalentamiento', daemon=True)
+    hilo.start()
+    return hilo
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from carga_datos import RUTA_CSV
+    from datos_compartidos import DatosCompartidos
+
+    parser = argparse.ArgumentParser(
+        description='Carga los datos, genera los límites simplificados y precalcula las vistas por defecto')
+    parser.add_argument('ruta', nargs='?', default=RUTA_CSV)
+    parser.add_argument('--nivel', default=NIVEL_PRECALENTADO, choices=['Departamento', 'Provincia', 'Distrito'])
+    args = parser.parse_args()
+
+    resultado = precalentar(DatosCompartidos(args.ruta), args.nivel)
+    for etapa, segundos in resultado.etapas.items():
+        print(f'{etapa:<14}{segundos:>9.3f} s')
+    print(f'Precalentamiento completo en {resultado.segundos:.3f} s: '
+          f'{resultado.vistas} vistas, {resultado.figuras} figuras en cache')
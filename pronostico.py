@@ -0,0 +1,271 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from carga_datos import DIR_CACHE, firma_archivo
+from figuras import cache_figuras
+from metricas import (TODOS_LOS_AÑOS, casos_por_año_semana, conteos_por_unidad, predicados,
+                      unidad_de_seleccion)
+from perfil import Medicion, log
+
+# Pronóstico semanal por unidad, entrenado fuera del dashboard (python pronostico.py) y
+# guardado junto al cache de datos; el gráfico de evolución solo lo lee.
+RUTA_PRONOSTICOS = os.environ.get('DENGUEAI_PRONOSTICOS', os.path.join(DIR_CACHE, 'pronosticos.parquet'))
+PROCESOS = int(os.environ.get('DENGUEAI_PROCESOS', os.cpu_count() or 1))
+HORIZONTE = int(os.environ.get('DENGUEAI_HORIZONTE', 8))
+NIVELES_PRONOSTICO = ['pais', 'departamento', 'provincia']
+CODIGO_PAIS = 'PE'
+# Modelo: ridge sobre log(1 + casos) con las RETARDOS semanas previas y la media estacional.
+RETARDOS = 4
+PENALIZACION = 1.0
+Z_PRONOSTICO = 1.64
+UNIDADES_POR_LOTE = 16
+
+Entrenamiento = namedtuple('Entrenamiento', [
+    'unidades', 'procesos', 'segundos', 'segundos_cpu', 'unidades_por_segundo', 'unidades_por_segundo_cpu',
+    'error_modelo', 'error_base', 'etapas',
+])
+
+
+def origen(motor):
+    # Última (año, semana) con casos en el cubo: los pronósticos empiezan en la siguiente.
+    def construir():
+        indice = casos_por_año_semana(motor, {})
+        año = int(indice['ano'].max())
+        return año, int(indice.loc[indice['ano'] == año, 'semana'].max())
+
+    return motor.agregado(('origen_pronostico',), construir)
+
+
+def series_por_nivel(motor, niveles=NIVELES_PRONOSTICO):
+    # Casos semanales continuos (unidades x semanas) de cada nivel hasta el origen, con un
+    # bincount por nivel. Devuelve el número de semanas por año y {nivel: (códigos, matriz)}.
+    año, semana = origen(motor)
+    desde = int(motor.tabla['ano'].min())
+    por_nivel = {}
+    for nivel in niveles:
+        columna = 'departamento' if nivel == 'pais' else nivel
+        codigos, conteos = conteos_por_unidad(motor, columna, np.arange(motor.n_filas), desde, año + 1)
+        n_semanas = conteos.shape[-1]
+        matriz = conteos.reshape(len(codigos), -1)[:, :(año - desde) * n_semanas + semana]
+        if nivel == 'pais':
+            codigos, matriz = [CODIGO_PAIS], matriz.sum(axis=0, keepdims=True)
+        por_nivel[nivel] = (list(codigos), matriz)
+    return n_semanas, por_nivel
+
+
+def _estacional(z, n_semanas, horizonte):
+    # Media de cada semana del año en los años anteriores (NaN el primer año), también para
+    # las `horizonte` semanas siguientes al final de la serie.
+    n_años = -(-(len(z) + horizonte) // n_semanas)
+    matriz = np.full(n_años * n_semanas, np.nan)
+    matriz[:len(z)] = z
+    matriz = matriz.reshape(n_años, n_semanas)
+    suma = np.nancumsum(matriz, axis=0)
+    cuenta = np.cumsum(np.isfinite(matriz), axis=0)
+    previa = np.full_like(matriz, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        previa[1:] = suma[:-1] / cuenta[:-1]
+    return previa.ravel()[:len(z) + horizonte]
+
+
+def ajustar_pronostico(serie, n_semanas, horizonte=HORIZONTE):
+    # Ajusta el modelo a una serie semanal y pronostica `horizonte` semanas de forma recursiva.
+    # Devuelve (pronóstico, inferior, superior) en casos, con un intervalo que crece con el paso.
+    z = np.log1p(np.asarray(serie, dtype=float))
+    estacional = np.nan_to_num(_estacional(z, n_semanas, horizonte))
+    filas = np.arange(max(n_semanas, RETARDOS), len(z))
+    if len(filas) < 4 * (RETARDOS + 2) or not z.any():
+        # Poca historia o sin casos: se repite la media estacional.
+        base = np.expm1(estacional[len(z):])
+        return base, base, base
+
+    def regresores(historia, estacion):
+        return np.concatenate([[1.0], historia[::-1][:RETARDOS], [estacion]])
+
+    X = np.column_stack([np.ones(len(filas))] + [z[filas - k] for k in range(1, RETARDOS + 1)]
+                        + [estacional[filas]])
+    y = z[filas]
+    penalizacion = PENALIZACION * np.eye(X.shape[1])
+    penalizacion[0, 0] = 0.0
+    coeficientes = np.linalg.solve(X.T @ X + penalizacion, X.T @ y)
+    residuos = y - X @ coeficientes
+    desviacion = np.sqrt(residuos @ residuos / max(len(y) - X.shape[1], 1))
+
+    historia = list(z[-RETARDOS:])
+    pronostico = np.empty(horizonte)
+    for paso in range(horizonte):
+        pronostico[paso] = max(regresores(np.array(historia), estacional[len(z) + paso]) @ coeficientes, 0.0)
+        historia.append(pronostico[paso])
+    margen = Z_PRONOSTICO * desviacion * np.sqrt(np.arange(1, horizonte + 1))
+    return (np.expm1(pronostico), np.expm1(np.clip(pronostico - margen, 0, None)),
+            np.expm1(pronostico + margen))
+
+
+def _ajustar_lote(lote):
+    # Trabajo de un proceso: ajusta y pronostica cada serie del lote, y mide el error del
+    # modelo y de la base estacional ingenua (misma semana del año anterior) en las últimas
+    # `horizonte` semanas, ajustando sin ellas.
+    series, n_semanas, horizonte = lote
+    inicio = time.process_time()
+    resultados = np.empty((len(series), 3, horizonte))
+    error_modelo = error_base = 0.0
+    for i, serie in enumerate(series):
+        resultados[i] = ajustar_pronostico(serie, n_semanas, horizonte)
+        if len(serie) > n_semanas + horizonte:
+            reales = serie[-horizonte:]
+            error_modelo += np.abs(ajustar_pronostico(serie[:-horizonte], n_semanas, horizonte)[0] - reales).sum()
+            error_base += np.abs(serie[-horizonte - n_semanas:-n_semanas] - reales).sum()
+    return resultados, error_modelo, error_base, time.process_time() - inicio
+
+
+def _semanas_siguientes(año, semana, n_semanas, horizonte):
+    posiciones = semana - 1 + np.arange(1, horizonte + 1)
+    return año + posiciones // n_semanas, posiciones % n_semanas + 1
+
+
+def entrenar(motor, procesos=PROCESOS, horizonte=HORIZONTE, niveles=NIVELES_PRONOSTICO,
+             ruta=RUTA_PRONOSTICOS):
+    medicion = Medicion()
+    año, semana = origen(motor)
+    n_semanas, por_nivel = series_por_nivel(motor, niveles)
+    lotes, claves = [], []
+    for nivel, (codigos, matriz) in por_nivel.items():
+        for inicio in range(0, len(codigos), UNIDADES_POR_LOTE):
+            lotes.append((matriz[inicio:inicio + UNIDADES_POR_LOTE], n_semanas, horizonte))
+            claves += [(nivel, codigo) for codigo in codigos[inicio:inicio + UNIDADES_POR_LOTE]]
+    medicion.marca('series')
+
+    inicio = time.perf_counter()
+    if procesos > 1:
+        with ProcessPoolExecutor(procesos) as pool:
+            resultados = list(pool.map(_ajustar_lote, lotes))
+    else:
+        resultados = [_ajustar_lote(lote) for lote in lotes]
+    segundos = time.perf_counter() - inicio
+    medicion.marca('entrenamiento')
+
+    valores = np.concatenate([resultado[0] for resultado in resultados])
+    anos, semanas = _semanas_siguientes(año, semana, n_semanas, horizonte)
+    tabla = pd.DataFrame({
+        'nivel': np.repeat([nivel for nivel, _ in claves], horizonte),
+        'codigo': np.repeat([codigo for _, codigo in claves], horizonte),
+        'ano': np.tile(anos, len(claves)),
+        'semana': np.tile(semanas, len(claves)),
+        'pronostico': valores[:, 0].ravel(),
+        'inferior': valores[:, 1].ravel(),
+        'superior': valores[:, 2].ravel(),
+    })
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    temporal = f'{ruta}.tmp'
+    tabla.to_parquet(temporal, index=False)
+    os.replace(temporal, ruta)
+    # El JSON se escribe al final: su firma marca una versión completa del pronóstico.
+    meta = {'origen': [año, semana], 'horizonte': horizonte, 'unidades': len(claves),
+            'entrenado': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(f'{ruta}.tmp.json', 'w', encoding='utf-8') as archivo:
+        json.dump(meta, archivo)
+    os.replace(f'{ruta}.tmp.json', _ruta_meta(ruta))
+    medicion.marca('guardado')
+
+    segundos_cpu = sum(resultado[3] for resultado in resultados)
+    n_puntos = len(claves) * horizonte
+    entrenamiento = Entrenamiento(
+        unidades=len(claves),
+        procesos=procesos,
+        segundos=segundos,
+        segundos_cpu=segundos_cpu,
+        unidades_por_segundo=len(claves) / segundos if segundos > 0 else 0.0,
+        unidades_por_segundo_cpu=len(claves) / segundos_cpu if segundos_cpu > 0 else 0.0,
+        error_modelo=sum(resultado[1] for resultado in resultados) / n_puntos,
+        error_base=sum(resultado[2] for resultado in resultados) / n_puntos,
+        etapas=medicion.etapas,
+    )
+    medicion.estado = {'unidades': len(claves), 'procesos': procesos, 'origen': [año, semana]}
+    medicion.registrar('pronostico')
+    return entrenamiento
+
+
+def _ruta_meta(ruta):
+    return os.path.splitext(ruta)[0] + '.json'
+
+
+_leidos = {}
+_lock_lectura = threading.Lock()
+
+
+def pronosticos_guardados(motor, ruta=RUTA_PRONOSTICOS):
+    # {(nivel, código): pronóstico} del último entrenamiento, o {} si no hay o si se entrenó
+    # con datos hasta otra semana. Solo se relee cuando cambia el archivo.
+    try:
+        firma = firma_archivo(_ruta_meta(ruta))
+    except OSError:
+        return {}
+    with _lock_lectura:
+        leido = _leidos.get(ruta)
+        if leido is None or leido[0] != firma:
+            with open(_ruta_meta(ruta), encoding='utf-8') as archivo:
+                meta = json.load(archivo)
+            tabla = pd.read_parquet(ruta)
+            por_unidad = {clave: grupo.drop(columns=['nivel', 'codigo']).reset_index(drop=True)
+                          for clave, grupo in tabla.groupby(['nivel', 'codigo'], sort=False)}
+            leido = _leidos[ruta] = (firma, tuple(meta['origen']), por_unidad)
+            log.info(f'Pronósticos de {len(por_unidad)} unidades desde la semana {meta["origen"][1]} '
+                     f'de {meta["origen"][0]} ({meta["entrenado"]})')
+            # Las figuras de evolución con el pronóstico anterior dejan de valer.
+            cache_figuras.invalidar(lambda clave: clave[0] == 'evolucion')
+    _, origen_guardado, por_unidad = leido
+    return por_unidad if origen_guardado == origen(motor) else {}
+
+
+def pronostico_vista(motor, filtro, ruta=RUTA_PRONOSTICOS):
+    # Pronóstico de la vista si es el país o exactamente un departamento o provincia, sin
+    # filtros de sexo ni edad, y su periodo llega a la última semana con datos; si no, None.
+    pronosticos = pronosticos_guardados(motor, ruta)
+    if not pronosticos:
+        return None
+    año, semana = origen(motor)
+    if filtro['año'] not in (TODOS_LOS_AÑOS, año) or filtro['semanas'][1] < semana:
+        return None
+    _, valores = predicados(filtro, motor.jerarquia)
+    if set(valores) - {'departamento', 'unidad'}:
+        return None
+    if 'unidad' not in valores and set(valores['departamento']) >= set(motor.tabla['departamento'].cat.categories):
+        return pronosticos.get(('pais', CODIGO_PAIS))
+    for columna in ('departamento', 'provincia'):
+        codigo = unidad_de_seleccion(motor, valores, columna)
+        if codigo is not None:
+            return pronosticos.get((columna, codigo))
+    return None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from carga_datos import RUTA_CSV
+    from datos_compartidos import DatosCompartidos
+
+    parser = argparse.ArgumentParser(
+        description='Entrena un modelo por departamento y provincia y guarda sus pronósticos semanales')
+    parser.add_argument('ruta', nargs='?', default=RUTA_CSV)
+    parser.add_argument('--procesos', type=int, default=PROCESOS)
+    parser.add_argument('--horizonte', type=int, default=HORIZONTE)
+    parser.add_argument('--salida', default=RUTA_PRONOSTICOS)
+    args = parser.parse_args()
+
+    motor = DatosCompartidos(args.ruta).obtener()
+    resultado = entrenar(motor, args.procesos, args.horizonte, ruta=args.salida)
+    for etapa, segundos in resultado.etapas.items():
+        print(f'{etapa:<14}{segundos:>9.3f} s')
+    print(f'{resultado.unidades} unidades con {resultado.procesos} proceso(s) en {resultado.segundos:.3f} s: '
+          f'{resultado.unidades_por_segundo:,.1f} unidades/s, '
+          f'{resultado.unidades_por_segundo_cpu:,.1f} unidades/s por núcleo')
+    print(f'Error absoluto medio en las últimas {args.horizonte} semanas: modelo {resultado.error_modelo:.2f}, '
+          f'misma semana del año anterior {resultado.error_base:.2f}')
+    print(f'Pronósticos desde la semana {origen(motor)[1]} de {origen(motor)[0]} en {args.salida}')
@@ -0,0 +1,134 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Puntos máximos de una serie enviada al navegador (~5 años de semanas).
+MAX_PUNTOS_SERIE = 260
+
+
+def serie_continua(casos_año_semana, años=None):
+    # Eje continuo (año, semana) con las semanas sin casos en 0: cada año cubre el mismo
+    # rango de semanas que los datos, y los años no se suman entre sí. `años` (mín., máx.)
+    # extiende el eje a años en los que la selección no tuvo casos.
+    if casos_año_semana.empty:
+        return casos_año_semana.assign(fecha=pd.Series(dtype='datetime64[ns]'))
+    if años is None:
+        años = (casos_año_semana['ano'].min(), casos_año_semana['ano'].max())
+    años = np.arange(años[0], años[1] + 1)
+    semanas = np.arange(casos_año_semana['semana'].min(), casos_año_semana['semana'].max() + 1)
+    indice = pd.MultiIndex.from_product([años, semanas], names=['ano', 'semana'])
+    serie = (casos_año_semana.set_index(['ano', 'semana'])['casos']
+             .reindex(indice, fill_value=0).reset_index())
+    serie['fecha'] = fecha_semana(serie['ano'], serie['semana'])
+    return serie
+
+
+def fecha_semana(anos, semanas):
+    # Inicio aproximado de la semana epidemiológica, para un eje de fechas.
+    return (pd.to_datetime(anos.astype(str) + '-01-01')
+            + pd.to_timedelta((semanas - 1) * 7, unit='D'))
+
+
+def promedio_movil(valores, ventana=3):
+    # Media de las últimas `ventana` observaciones (menos al inicio), con sumas acumuladas.
+    valores = np.asarray(valores, dtype=float)
+    acumulado = np.concatenate([[0.0], np.cumsum(valores)])
+    fin = np.arange(1, len(valores) + 1)
+    inicio = np.maximum(fin - ventana, 0)
+    return (acumulado[fin] - acumulado[inicio]) / (fin - inicio)
+
+
+def lttb(x, y, n_puntos):
+    # Largest-Triangle-Three-Buckets: conserva el primer y el último punto y, en cada tramo,
+    # el que forma el triángulo de mayor área con el punto elegido antes y la media del tramo
+    # siguiente. Mantiene picos y valles. Devuelve las posiciones elegidas.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_puntos >= n or n_puntos < 3:
+        return np.arange(n)
+
+    limites = np.linspace(1, n - 1, n_puntos - 1).astype(int)
+    elegidos = np.empty(n_puntos, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+    anterior = 0
+    for i in range(n_puntos - 2):
+        inicio, fin = limites[i], limites[i + 1]
+        siguiente_inicio, siguiente_fin = limites[i + 1], limites[i + 2] if i + 2 < len(limites) else n
+        media_x = x[siguiente_inicio:siguiente_fin].mean()
+        media_y = y[siguiente_inicio:siguiente_fin].mean()
+        areas = np.abs((x[anterior] - media_x) * (y[inicio:fin] - y[anterior])
+                       - (x[anterior] - x[inicio:fin]) * (media_y - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        elegidos[i + 1] = anterior
+    return elegidos
+
+
+def reducir_serie(serie, columna='casos', max_puntos=MAX_PUNTOS_SERIE):
+    if len(serie) <= max_puntos:
+        return serie
+    return serie.iloc[lttb(np.arange(len(serie)), serie[columna].to_numpy(), max_puntos)]
+
+
+# Canal endémico: bandas por semana a partir de los años anteriores.
+AÑOS_CANAL = 5
+MIN_AÑOS_CANAL = 3
+CUANTILES_CANAL = (25, 50, 75)
+BANDAS_CANAL = ['inferior', 'mediana', 'superior']
+Z_CANAL = 1.96
+
+
+def _percentiles(valores, percentiles):
+    # Percentiles (interpolación lineal, como np.nanpercentile) sobre el eje -2 ignorando NaN,
+    # sin recorrer las series una por una: se ordena una vez y se indexa.
+    ordenados = np.sort(valores, axis=-2)
+    validos = np.isfinite(valores).sum(axis=-2, keepdims=True)
+    resultado = []
+    for percentil in percentiles:
+        posicion = (validos - 1).clip(min=0) * percentil / 100
+        bajo = np.floor(posicion).astype(np.int64)
+        alto = np.ceil(posicion).astype(np.int64)
+        valor_bajo = np.take_along_axis(ordenados, bajo, axis=-2)
+        valor_alto = np.take_along_axis(ordenados, alto, axis=-2)
+        resultado.append(valor_bajo + (valor_alto - valor_bajo) * (posicion - bajo))
+    return np.concatenate(resultado, axis=-2)
+
+
+def bandas_endemicas(historico, metodo='cuartiles'):
+    # historico: (..., años, semanas), con NaN para años sin datos. Devuelve (..., 3, semanas):
+    # cuartiles 1-3 o media geométrica con su intervalo del 95 %, NaN si hay pocos años.
+    historico = np.asarray(historico, dtype=float)
+    suficientes = (np.isfinite(historico).sum(axis=-2) >= MIN_AÑOS_CANAL)[..., None, :]
+    with warnings.catch_warnings():
+        # Las semanas sin historia (todo NaN) dan NaN, que es lo esperado.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if metodo == 'cuartiles':
+            bandas = _percentiles(historico, CUANTILES_CANAL)
+        elif metodo == 'media_geometrica':
+            logaritmos = np.log1p(historico)
+            media = np.nanmean(logaritmos, axis=-2)
+            desviacion = np.nanstd(logaritmos, axis=-2, ddof=1)
+            bandas = np.stack([np.expm1(media - Z_CANAL * desviacion).clip(min=0),
+                               np.expm1(media),
+                               np.expm1(media + Z_CANAL * desviacion)], axis=-2)
+        else:
+            raise ValueError(f'Método de canal endémico desconocido: {metodo}')
+    return np.where(suficientes, bandas, np.nan)
+
+
+def canal_endemico(conteos, metodo='cuartiles'):
+    # conteos: (..., años consecutivos, semanas). Devuelve (..., años, 3, semanas): las bandas de
+    # cada año calculadas con sus AÑOS_CANAL años anteriores, todo en una pasada vectorizada.
+    conteos = np.asarray(conteos, dtype=float)
+    relleno = np.full(conteos.shape[:-2] + (AÑOS_CANAL, conteos.shape[-1]), np.nan)
+    previos = np.concatenate([relleno, conteos[..., :-1, :]], axis=-2)
+    ventanas = np.lib.stride_tricks.sliding_window_view(previos, AÑOS_CANAL, axis=-2)
+    return bandas_endemicas(np.moveaxis(ventanas, -1, -2), metodo)
+
+
+def matriz_año_semana(serie):
+    # Serie continua (ver serie_continua) -> años, semanas y matriz años x semanas.
+    años = np.unique(serie['ano'].to_numpy())
+    semanas = np.unique(serie['semana'].to_numpy())
+    return años, semanas, serie['casos'].to_numpy(dtype=float).reshape(len(años), len(semanas))
@@ -0,0 +1,123 @@
+import json
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from carga_datos import RUTA_CSV
+from datos_compartidos import DatosCompartidos
+from metricas import calcular_metricas, metricas_a_dict
+
+PUERTO = 8600
+CAMPOS_LISTA = ['departamentos', 'provincias', 'distritos']
+
+
+def filtro_desde_query(query):
+    # ?año=2024&nivel=Distrito&semanas=1-20&departamentos=LIMA,PIURA
+    filtro = {}
+    for campo, valores in parse_qs(query).items():
+        valor = valores[-1]
+        if campo in CAMPOS_LISTA:
+            filtro[campo] = [v for v in valor.split(',') if v]
+        elif campo == 'semanas':
+            filtro[campo] = valor.split('-', 1)
+        else:
+            filtro[campo] = valor
+    return filtro
+
+
+class ManejadorMetricas(BaseHTTPRequestHandler):
+    datos = None
+
+    def _responder(self, estado, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _motor(self):
+        # Sin datos (CSV ausente o ilegible, límite de memoria) responde 500 con el motivo.
+        try:
+            return self.datos.obtener()
+        except Exception as e:
+            self._responder(500, {'estado': 'error', 'error': f'No se pudieron cargar los datos: {e}'})
+            return None
+
+    def _metricas(self, filtro):
+        motor = self._motor()
+        if motor is None:
+            return
+        try:
+            metricas = calcular_metricas(motor, filtro)
+        except (TypeError, ValueError) as e:
+            self._responder(400, {'error': str(e)})
+            return
+        self._responder(200, metricas_a_dict(metricas))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/salud':
+            motor = self._motor()
+            if motor is not None:
+                self._responder(200, {'estado': 'ok', 'celdas': motor.n_filas,
+                                      'memoria_mb': self.datos.memoria_bytes() / 1024 ** 2})
+        elif url.path == '/metricas':
+            self._metricas(filtro_desde_query(url.query))
+        else:
+            self._responder(404, {'error': f'Ruta desconocida: {url.path}'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/metricas':
+            self._responder(404, {'error': f'Ruta desconocida: {url.path}'})
+            return
+        try:
+            largo = int(self.headers.get('Content-Length', 0))
+            filtro = json.loads(self.rfile.read(largo) or b'{}')
+        except ValueError as e:
+            self._responder(400, {'error': f'JSON inválido: {e}'})
+            return
+        if not isinstance(filtro, dict):
+            self._responder(400, {'error': 'El filtro debe ser un objeto JSON'})
+            return
+        self._metricas(filtro)
+
+
+def crear_servidor(datos, host='127.0.0.1', puerto=PUERTO):
+    manejador = type('Manejador', (ManejadorMetricas,), {'datos': datos})
+    return ThreadingHTTPServer((host, puerto), manejador)
+
+
+def consultar_metricas(filtro=None, url=f'http://127.0.0.1:{PUERTO}', timeout=30):
+    solicitud = urllib.request.Request(
+        f'{url}/metricas',
+        data=json.dumps(filtro or {}).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(solicitud, timeout=timeout) as respuesta:
+        return json.load(respuesta)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Servidor JSON de métricas de dengue')
+    parser.add_argument('ruta', nargs='?', default=RUTA_CSV)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=PUERTO)
+    args = parser.parse_args()
+
+    datos = DatosCompartidos(args.ruta)
+    inicio = time.perf_counter()
+    datos.obtener()
+    print(f'Datos cargados en {time.perf_counter() - inicio:.2f} s ({datos.memoria_bytes() / 1024 ** 2:,.1f} MB)')
+    servidor = crear_servidor(datos, args.host, args.puerto)
+    print(f'Sirviendo métricas en http://{args.host}:{args.puerto}/metricas')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
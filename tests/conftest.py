@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from carga_datos import cargar_cubo  # noqa: E402
+from datos_sinteticos import generar_csv, generar_poblacion  # noqa: E402
+from filtros import crear_motor  # noqa: E402
+
+FILAS_PRUEBA = 30_000
+AÑOS_PRUEBA = tuple(range(2018, 2024))
+
+
+@pytest.fixture(scope='session')
+def datos_prueba(tmp_path_factory):
+    # CSV sintético pequeño con su tabla de población y su cache, compartidos por todas las pruebas.
+    directorio = tmp_path_factory.mktemp('datos')
+    ruta = str(directorio / 'datos_dengue.csv')
+    unidades = generar_csv(ruta, FILAS_PRUEBA, años=AÑOS_PRUEBA)
+    ruta_poblacion = str(directorio / 'poblacion.csv')
+    generar_poblacion(unidades, años=AÑOS_PRUEBA).to_csv(ruta_poblacion, index=False)
+    return ruta, ruta_poblacion, str(directorio / 'cache')
+
+
+@pytest.fixture(scope='session')
+def motor(datos_prueba):
+    ruta, ruta_poblacion, dir_cache = datos_prueba
+    cubo, _ = cargar_cubo(ruta, dir_cache=dir_cache, dir_nuevos=os.path.join(dir_cache, 'nuevos'))
+    return crear_motor(cubo)
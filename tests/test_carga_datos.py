@@ -0,0 +1,51 @@
+import pandas as pd
+
+from carga_datos import BLOQUES_POR_COMBINACION, actualizar_cache, agregar_por_bloques, cargar_cubo, leer_csv
+from cubo import DIMENSIONES, construir_cubo
+
+
+def _ordenado(cubo):
+    # Mismas celdas sin depender del orden de filas ni de las categorías de cada cubo.
+    cubo = cubo.astype({columna: str for columna in cubo.select_dtypes('category').columns})
+    return cubo.astype({'ano': int, 'semana': int}).sort_values(DIMENSIONES).reset_index(drop=True)
+
+
+def test_ingesta_incremental_igual_a_reconstruccion(datos_prueba, tmp_path):
+    ruta_completa = datos_prueba[0]
+    with open(ruta_completa, 'rb') as archivo:
+        lineas = archivo.readlines()
+    corte = len(lineas) * 2 // 3
+    ruta = tmp_path / 'casos.csv'
+    ruta.write_bytes(b''.join(lineas[:corte]))
+    nuevos = tmp_path / 'nuevas_semanas'
+    nuevos.mkdir()
+    dir_cache = str(tmp_path / 'cache')
+    assert actualizar_cache(str(ruta), dir_cache, str(nuevos)).tipo == 'completa'
+
+    # Filas añadidas al final del CSV y un archivo semanal nuevo, en una sola ingesta.
+    with open(ruta, 'ab') as archivo:
+        archivo.writelines(lineas[corte:-500])
+    (nuevos / 'semana.csv').write_bytes(lineas[0] + b''.join(lineas[-500:]))
+    actualizacion = actualizar_cache(str(ruta), dir_cache, str(nuevos))
+    assert actualizacion.tipo == 'incremental'
+    assert actualizacion.filas_nuevas == len(lineas) - corte
+
+    incremental, _ = cargar_cubo(str(ruta), dir_cache, str(nuevos))
+    completo, actualizacion = cargar_cubo(str(ruta), str(tmp_path / 'otro_cache'), str(nuevos))
+    assert actualizacion.tipo == 'completa'
+    pd.testing.assert_frame_equal(_ordenado(incremental), _ordenado(completo))
+    assert incremental['casos'].sum() == len(lineas) - 1
+
+
+def test_cubo_por_bloques_igual_al_cubo_en_memoria(datos_prueba):
+    ruta = datos_prueba[0]
+    bloques = []
+    # Bloques pequeños: se combinan parciales varias veces antes del resultado final.
+    por_bloques = agregar_por_bloques(ruta, filas_por_bloque=1_000, al_procesar=bloques.append)
+    en_memoria = construir_cubo(leer_csv(ruta))
+    assert len(bloques) > 2 * BLOQUES_POR_COMBINACION
+    assert sum(bloque.filas for bloque in bloques) == en_memoria['casos'].sum()
+    for columna in por_bloques.select_dtypes('category').columns:
+        categorias = por_bloques[columna].cat.categories
+        assert list(categorias) == sorted(categorias)
+    pd.testing.assert_frame_equal(_ordenado(por_bloques), _ordenado(en_memoria))
@@ -0,0 +1,77 @@
+import gc
+import threading
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from datos_compartidos import DatosCompartidos
+from metricas import calcular_metricas
+
+SESIONES = 8
+# Memoria máxima que puede retener cada sesión: solo los agregados de su vista (~70 KB, sin
+# importar el tamaño de los datos), nunca una copia del cubo (~1.5 MB aquí) ni de sus índices.
+MAX_BYTES_POR_SESION = 256 * 1024
+
+
+def test_sesiones_concurrentes_comparten_el_dataset(datos_prueba, tmp_path, monkeypatch):
+    ruta, ruta_poblacion, _ = datos_prueba
+    monkeypatch.chdir(tmp_path)  # cache y nuevas semanas por defecto, relativos al directorio
+    datos = DatosCompartidos(ruta, ruta_poblacion=ruta_poblacion)
+    filtro = {'año': '2023'}
+    primera = calcular_metricas(datos.obtener(), filtro)
+    dataset = datos.memoria_bytes()
+
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    sesiones = [None] * SESIONES
+
+    def abrir_sesion(i):
+        motor = datos.obtener()
+        sesiones[i] = (motor, calcular_metricas(motor, filtro))
+
+    hilos = [threading.Thread(target=abrir_sesion, args=(i,)) for i in range(SESIONES)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    gc.collect()
+    despues = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    assert datos.cargas == 1
+    assert all(motor is sesiones[0][0] for motor, _ in sesiones)
+    assert all(metricas.casos_totales == primera.casos_totales for _, metricas in sesiones)
+    por_sesion = sum(diferencia.size_diff for diferencia in despues.compare_to(antes, 'filename')) / SESIONES
+    assert dataset > 2 * MAX_BYTES_POR_SESION
+    assert por_sesion < MAX_BYTES_POR_SESION, \
+        f'{por_sesion / 1024:,.1f} KB por sesión con un dataset de {dataset / 1024:,.1f} KB'
+
+
+def test_limite_de_memoria_no_recarga_los_mismos_datos(datos_prueba, tmp_path, monkeypatch):
+    import datos_compartidos
+
+    ruta, ruta_poblacion, _ = datos_prueba
+    monkeypatch.chdir(tmp_path)
+    lecturas = []
+    original = datos_compartidos.cargar_cubo
+
+    def cargar_cubo(*args):
+        lecturas.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(datos_compartidos, 'cargar_cubo', cargar_cubo)
+    datos = DatosCompartidos(ruta, max_bytes=1024, ruta_poblacion=ruta_poblacion)
+    for _ in range(3):
+        with pytest.raises(MemoryError, match='DENGUEAI_MAX_MB_DATOS'):
+            datos.obtener()
+    assert len(lecturas) == 1 and datos.cargas == 0
+
+    # El error se recuerda solo para esa versión de los datos: con una semana nueva se reintenta.
+    datos.max_bytes = 0
+    nuevos = tmp_path / 'nuevas_semanas'
+    nuevos.mkdir()
+    pd.read_csv(ruta, nrows=10).to_csv(nuevos / 'semana.csv', index=False)
+    assert datos.obtener().n_filas > 0
+    assert len(lecturas) == 2 and datos.cargas == 1
@@ -0,0 +1,49 @@
+import pandas as pd
+
+from datos_compartidos import DatosCompartidos
+from figuras import (cache_figuras, claves_paneles, figura_cacheada, figura_evolucion, figura_riesgo,
+                     figura_top_geos)
+from metricas import calcular_metricas, estado_vista
+
+
+def test_ingesta_de_años_previos_reconstruye_figuras_con_historia(datos_prueba, tmp_path, monkeypatch):
+    # La evolución semanal (canal endémico) y el riesgo (exceso sobre la base) usan los años
+    # previos: filas tardías de esos años invalidan sus figuras, pero no las de paneles que solo dependen del año de la vista.
+    ruta = datos_prueba[0]
+    monkeypatch.chdir(tmp_path)  # cache y nuevas semanas por defecto, relativos al directorio
+    datos = DatosCompartidos(ruta, ruta_poblacion=str(tmp_path / 'sin_poblacion.csv'))
+    casos = pd.read_csv(ruta)
+    año = int(casos['ano'].max())
+    cache_figuras.invalidar()
+    construidas = []
+
+    def figuras(motor):
+        metricas = calcular_metricas(motor, {'año': año})
+        claves = claves_paneles(estado_vista(motor, metricas.filtro))
+
+        def construir(nombre, figura):
+            def construir_figura():
+                construidas.append(nombre)
+                return figura()
+            return construir_figura
+
+        figura_cacheada('evolucion', claves['evolucion'], construir('evolucion', lambda: figura_evolucion(
+            metricas.casos_semana, str(año), metricas.canal)))
+        figura_cacheada('top_geos', claves['top_geos'], construir('top_geos', lambda: figura_top_geos(
+            metricas.top_geos, metricas.geo_column, 'Departamento', str(año))))
+        figura_cacheada('riesgo', claves['riesgo'], construir('riesgo', lambda: figura_riesgo(
+            metricas.riesgo, metricas.geo_column)))
+        return metricas
+
+    antes = figuras(datos.obtener())
+    figuras(datos.obtener())
+    assert construidas == ['evolucion', 'top_geos', 'riesgo']
+
+    tardias = casos[casos['ano'] == año - 1]
+    (tmp_path / 'nuevas_semanas').mkdir()
+    pd.concat([tardias] * 3).to_csv(tmp_path / 'nuevas_semanas' / 'tardias.csv', index=False)
+    despues = figuras(datos.obtener())
+    assert datos.cargas == 2
+    assert not despues.canal.equals(antes.canal)
+    assert not despues.riesgo.equals(antes.riesgo)
+    assert construidas == ['evolucion', 'top_geos', 'riesgo', 'evolucion', 'riesgo']
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from filtros import MAX_VALORES_BITMAP
+
+
+def _mascara(tabla, rangos, valores):
+    mascara = np.ones(len(tabla), dtype=bool)
+    for columna, (minimo, maximo) in rangos.items():
+        mascara &= tabla[columna].between(minimo, maximo).to_numpy()
+    for columna, lista in valores.items():
+        mascara &= tabla[columna].isin(lista).to_numpy()
+    return mascara
+
+
+def _selecciones(tabla, semilla=0):
+    # Combinaciones de rangos y valores sobre columnas con bitmap y con índice invertido.
+    rng = np.random.default_rng(semilla)
+
+    def algunos(columna, n):
+        categorias = tabla[columna].cat.categories
+        return rng.choice(categorias, size=min(n, len(categorias)), replace=False).tolist()
+
+    unidades = algunos('unidad', 40)
+    yield {}, {}
+    yield {'ano': (2020, 2021)}, {}
+    yield {'semana': (5, 20)}, {'sexo': ['F']}
+    yield {'ano': (2023, 2023), 'semana': (1, 52)}, {'tipo_edad': algunos('tipo_edad', 2)}
+    yield {}, {'departamento': algunos('departamento', 3), 'provincia': algunos('provincia', 20)}
+    yield {'semana': (10, 30)}, {'distrito': algunos('distrito', 50), 'sexo': ['M']}
+    yield {'ano': (2019, 2022)}, {'unidad': unidades, 'tipo_edad': algunos('tipo_edad', 3)}
+    yield {'ano': (1990, 1991)}, {'unidad': unidades}
+    yield {}, {'departamento': ['NO EXISTE']}
+
+
+def test_seleccion_igual_a_mascara_de_pandas(motor):
+    tabla = motor.tabla
+    # Las pruebas recorren los dos tipos de índice: bitmaps y posiciones por valor.
+    assert len(tabla['sexo'].cat.categories) <= MAX_VALORES_BITMAP < len(tabla['distrito'].cat.categories)
+    for rangos, valores in _selecciones(tabla):
+        esperadas = np.flatnonzero(_mascara(tabla, rangos, valores))
+        seleccion = motor.seleccionar(rangos, valores)
+        np.testing.assert_array_equal(seleccion.filas, esperadas)
+        if seleccion.conteos:
+            assert seleccion.conteos[-1][1] == len(esperadas)
+
+
+@pytest.mark.parametrize('semilla', range(3))
+def test_seleccion_aleatoria_igual_a_mascara_de_pandas(motor, semilla):
+    tabla = motor.tabla
+    rng = np.random.default_rng(semilla)
+    for _ in range(20):
+        rangos = {'ano': tuple(sorted(rng.integers(2017, 2025, size=2))),
+                  'semana': tuple(sorted(rng.integers(1, 54, size=2)))}
+        valores = {columna: rng.choice(tabla[columna].cat.categories, size=rng.integers(1, 6)).tolist()
+                   for columna in ('sexo', 'departamento', 'distrito') if rng.random() < 0.5}
+        esperadas = np.flatnonzero(_mascara(tabla, rangos, valores))
+        np.testing.assert_array_equal(motor.seleccionar(rangos, valores).filas, esperadas)
@@ -0,0 +1,65 @@
+import os
+import threading
+
+import pytest
+
+import geometrias
+from datos_sinteticos import generar_limites, generar_unidades
+
+
+@pytest.fixture
+def dir_limites(tmp_path, monkeypatch):
+    # Límites sintéticos sin caches simplificados, y las caches en memoria vacías.
+    generar_limites(generar_unidades(), str(tmp_path))
+    monkeypatch.setattr(geometrias, 'DIR_GEOJSON', str(tmp_path))
+    for funcion in (geometrias._cargar_geojson, geometrias._cargar_topojson, geometrias._centroides):
+        funcion.cache_clear()
+    yield tmp_path
+    for funcion in (geometrias._cargar_geojson, geometrias._cargar_topojson, geometrias._centroides):
+        funcion.cache_clear()
+
+
+def test_construccion_concurrente(dir_limites):
+    # Dos hilos con la cache fría (p. ej. precalentamiento y primera sesión) construyen el
+    # mismo archivo sin errores y obtienen la misma topología.
+    resultados, errores = [], []
+    inicio = threading.Barrier(4)
+
+    def cargar():
+        inicio.wait()
+        try:
+            resultados.append(geometrias.cargar_topojson('Distrito'))
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=cargar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert not errores
+    assert all(resultado == resultados[0] for resultado in resultados)
+    simplificado = dir_limites / 'simplificado'
+    assert not [nombre for nombre in os.listdir(simplificado) if nombre.endswith('.tmp')]
+
+
+def test_cambio_de_original_regenera_simplificados(dir_limites):
+    nombre = geometrias.PROPIEDADES['Departamento']
+    anterior = geometrias.cargar_topojson('Departamento')
+    geometrias.cargar_geojson('Departamento')
+
+    ruta = geometrias.ruta_geojson('Departamento')
+    original = geometrias._leer_json(ruta)
+    original['features'][0]['properties'][nombre] = 'DEPARTAMENTO RENOMBRADO'
+    geometrias._guardar_json(original, ruta)
+
+    for limites in (geometrias.cargar_topojson('Departamento')['objects']['limites']['geometries'],
+                    geometrias.cargar_geojson('Departamento')['features']):
+        assert limites[0]['properties'][nombre] == 'DEPARTAMENTO RENOMBRADO'
+    assert anterior['objects']['limites']['geometries'][0]['properties'][nombre] != 'DEPARTAMENTO RENOMBRADO'
+
+    # Con la cache en memoria vacía (otro proceso), los archivos regenerados siguen vigentes.
+    geometrias._cargar_topojson.cache_clear()
+    geometrias._cargar_geojson.cache_clear()
+    topologia = geometrias.cargar_topojson('Departamento')
+    assert topologia['objects']['limites']['geometries'][0]['properties'][nombre] == 'DEPARTAMENTO RENOMBRADO'
@@ -0,0 +1,32 @@
+import pandas as pd
+
+from carga_datos import cargar_cubo
+from jerarquia import NIVELES_GEOGRAFICOS, Jerarquia
+
+
+def test_codigos_son_ubigeo_y_estables(datos_prueba, tmp_path):
+    # Los códigos son el UBIGEO de los casos y no cambian cuando una ingesta incremental trae
+    # un distrito nuevo que, por orden alfabético, quedaría antes que los existentes.
+    ruta = datos_prueba[0]
+    dir_cache, dir_nuevos = str(tmp_path / 'cache'), tmp_path / 'nuevos'
+    casos = pd.read_csv(ruta)
+    jerarquia = Jerarquia(cargar_cubo(ruta, dir_cache=dir_cache, dir_nuevos=str(dir_nuevos))[0])
+    unidades = jerarquia.unidades.set_index('codigo')
+    ubigeos = casos.drop_duplicates('ubigeo').set_index('ubigeo')
+    for ubigeo, caso in ubigeos.iterrows():
+        unidad = unidades.loc[f'{ubigeo:06d}']
+        assert (unidad['departamento'], unidad['provincia'], unidad['distrito']) == \
+            (caso['departamento'], caso['provincia'], caso['distrito'])
+        assert unidad['codigo_provincia'] == f'{ubigeo:06d}'[:4]
+
+    primero = casos.iloc[0]
+    nuevo = casos.iloc[[0]].assign(distrito='AAA DISTRITO NUEVO', ubigeo=primero['ubigeo'] // 100 * 100 + 99,
+                                   ano=casos['ano'].max(), semana=casos['semana'].max())
+    dir_nuevos.mkdir()
+    nuevo.to_csv(dir_nuevos / 'semana_nueva.csv', index=False)
+    cubo, actualizacion = cargar_cubo(ruta, dir_cache=dir_cache, dir_nuevos=str(dir_nuevos))
+    assert actualizacion.tipo == 'incremental'
+    despues = Jerarquia(cubo).unidades.set_index('codigo')
+    assert despues.loc[unidades.index, NIVELES_GEOGRAFICOS].equals(unidades[NIVELES_GEOGRAFICOS])
+    assert despues.loc[f"{nuevo['ubigeo'].iloc[0]:06d}", 'distrito'] == 'AAA DISTRITO NUEVO'
+
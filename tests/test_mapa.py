@@ -0,0 +1,22 @@
+import pandas as pd
+
+from mapa import unir_casos
+from union_geo import IndiceUnion
+
+
+def _topologia():
+    geometrias = [{'type': 'Polygon', 'arcs': [[i]], 'properties': {'NOMBDEP': nombre}}
+                  for i, nombre in enumerate(['LORETO', 'PIURA'])]
+    return {'type': 'Topology', 'arcs': [], 'objects': {'limites': {'type': 'GeometryCollection',
+                                                                      'geometries': geometrias}}}
+
+
+def test_incidencia_sin_poblacion():
+    # Sin columna de población no hay tasas: el mapa de incidencia queda sin valores.
+    indice = IndiceUnion(['departamento'], {('LORETO',): 0, ('PIURA',): 1}, [], [])
+    casos_geo = pd.DataFrame({'departamento': ['LORETO', 'PIURA'], 'casos': [10, 0]})
+    topologia, valores = unir_casos(_topologia(), casos_geo, indice, 10, medida='incidencia')
+    assert valores == {}
+    assert topologia['objects']['limites']['geometries'][0]['properties']['casos'] == 10
+    _, valores = unir_casos(_topologia(), casos_geo, indice, 10)
+    assert valores == {0: 10}
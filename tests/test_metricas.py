@@ -0,0 +1,60 @@
+import pytest
+
+from metricas import TODOS_LOS_AÑOS, calcular_metricas, metricas_a_dict
+
+
+def _distrito(motor):
+    unidad = motor.jerarquia.unidades.iloc[0]
+    return {'nivel': 'Distrito', 'departamentos': [unidad['departamento']],
+            'provincias': [unidad['provincia']], 'distritos': [unidad['codigo']]}
+
+
+def test_riesgo_de_seleccion_sin_casos(motor):
+    # Sin casos en ningún año no hay semana de referencia: el riesgo queda vacío en vez de fallar.
+    for filtro in ({'sexo': 'X'}, {**_distrito(motor), 'tipo_edad': 'SIN GRUPO'}):
+        metricas = calcular_metricas(motor, {'año': TODOS_LOS_AÑOS, **filtro})
+        assert metricas.casos_totales == 0
+        assert metricas.riesgo.empty
+        assert metricas_a_dict(metricas)['kpis']['casos_totales'] == 0
+
+
+def test_riesgo_de_seleccion_con_casos(motor):
+    metricas = calcular_metricas(motor, {'año': TODOS_LOS_AÑOS})
+    assert not metricas.riesgo.empty
+    assert metricas.riesgo['puntaje_riesgo'].between(0, 100).all()
+
+
+def test_poblacion_incluye_distritos_sin_casos(datos_prueba, motor):
+    # Los denominadores suman todos los distritos de la tabla de población, tengan o no casos.
+    from filtros import crear_motor
+    from poblacion import cargar_tabla_poblacion
+
+    tabla = cargar_tabla_poblacion(datos_prueba[1])
+    con_poblacion = crear_motor(motor.tabla.drop(columns='unidad'), tabla)
+    assert len(con_poblacion.poblacion.sin_unidad) > 0
+    año = int(tabla['ano'].min())
+    del_año = tabla[tabla['ano'] == año]
+    metricas = calcular_metricas(con_poblacion, {'año': año})
+    assert metricas.poblacion == del_año['poblacion'].sum()
+    por_departamento = del_año.groupby('departamento')['poblacion'].sum()
+    casos_geo = metricas.casos_geo.set_index('departamento')['poblacion']
+    assert (casos_geo == por_departamento.reindex(casos_geo.index.astype(str)).to_numpy()).all()
+
+    unidad = con_poblacion.jerarquia.unidades.iloc[0]
+    metricas = calcular_metricas(con_poblacion, {'año': año, 'nivel': 'Provincia',
+                                                 'departamentos': [unidad['departamento']],
+                                                 'provincias': [unidad['codigo_provincia']]})
+    provincia = del_año[(del_año['departamento'] == unidad['departamento'])
+                        & (del_año['provincia'] == unidad['provincia'])]
+    assert metricas.poblacion == provincia['poblacion'].sum()
+
+
+def test_filtro_con_texto_o_valores_desconocidos(motor):
+    # Un nombre suelto equivale a una lista de uno; lo que no es lista o no existe es un error.
+    departamento = motor.tabla['departamento'].cat.categories[0]
+    solo = calcular_metricas(motor, {'departamentos': departamento})
+    assert solo.casos_totales == calcular_metricas(motor, {'departamentos': [departamento]}).casos_totales
+    for filtro in ({'departamentos': 3}, {'departamentos': ['NO EXISTE']},
+                   {**_distrito(motor), 'provincias': ['NO EXISTE']}, {**_distrito(motor), 'distritos': '999999'}):
+        with pytest.raises(ValueError):
+            calcular_metricas(motor, filtro)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from series import AÑOS_CANAL, CUANTILES_CANAL, MIN_AÑOS_CANAL, canal_endemico, lttb, reducir_serie
+
+
+@pytest.mark.parametrize('n, n_puntos', [(1000, 260), (261, 260), (100, 3), (53, 10)])
+def test_lttb_conserva_extremos_y_cantidad(n, n_puntos):
+    rng = np.random.default_rng(n)
+    y = rng.poisson(20, n).astype(float)
+    y[n // 3] = 500  # un pico aislado no se pierde al reducir
+    elegidos = lttb(np.arange(n), y, n_puntos)
+    assert len(elegidos) == n_puntos
+    assert elegidos[0] == 0 and elegidos[-1] == n - 1
+    assert (np.diff(elegidos) > 0).all()
+    assert n // 3 in elegidos
+
+
+def test_lttb_sin_reduccion_devuelve_todo():
+    for n_puntos in (2, 50, 80):
+        np.testing.assert_array_equal(lttb(np.arange(50), np.ones(50), n_puntos), np.arange(50))
+
+
+def test_reducir_serie_limita_puntos():
+    serie = pd.DataFrame({'casos': np.arange(1000) % 37})
+    reducida = reducir_serie(serie, max_puntos=100)
+    assert len(reducida) == 100
+    assert reducida.index[0] == 0 and reducida.index[-1] == 999
+    corta = serie.head(100)
+    assert reducir_serie(corta, max_puntos=100) is corta
+
+
+def test_canal_endemico_cuartiles_de_los_años_anteriores():
+    rng = np.random.default_rng(0)
+    conteos = rng.poisson(30, (4, 9, 52)).astype(float)
+    bandas = canal_endemico(conteos)
+    assert bandas.shape == (4, 9, 3, 52)
+    for unidad in range(conteos.shape[0]):
+        for año in range(conteos.shape[1]):
+            anteriores = conteos[unidad, max(año - AÑOS_CANAL, 0):año]
+            if len(anteriores) < MIN_AÑOS_CANAL:
+                assert np.isnan(bandas[unidad, año]).all()
+            else:
+                np.testing.assert_allclose(bandas[unidad, año], np.percentile(anteriores, CUANTILES_CANAL, axis=0))
+    # Cada unidad da lo mismo sola que dentro del lote.
+    np.testing.assert_allclose(canal_endemico(conteos[1]), bandas[1])
@@ -0,0 +1,30 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from datos_compartidos import DatosCompartidos
+from servidor import crear_servidor
+
+
+@pytest.fixture
+def url_sin_datos(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    servidor = crear_servidor(DatosCompartidos(str(tmp_path / 'no_existe.csv')), puerto=0)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield f'http://127.0.0.1:{servidor.server_address[1]}'
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.mark.parametrize('ruta', ['/salud', '/metricas?a%C3%B1o=2023'])
+def test_sin_datos_responde_500(url_sin_datos, ruta):
+    # Un CSV ausente no corta la conexión: la respuesta es un JSON con el error.
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f'{url_sin_datos}{ruta}', timeout=30)
+    assert error.value.code == 500
+    cuerpo = json.load(error.value)
+    assert cuerpo['estado'] == 'error' and 'no_existe.csv' in cuerpo['error']
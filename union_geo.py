@@ -0,0 +1,93 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+from jerarquia import ruta_nivel
+from perfil import log
+
+# Propiedades de nombre de los límites (peru-geojson), de departamento a distrito.
+PROPIEDADES_RUTA = ['NOMBDEP', 'NOMBPROV', 'NOMBDIST']
+
+# Variantes conocidas, ya normalizadas, y su nombre canónico.
+ALIAS = {
+    'PROV CONST DEL CALLAO': 'CALLAO',
+    'PROVINCIA CONSTITUCIONAL DEL CALLAO': 'CALLAO',
+    'LIMA METROPOLITANA': 'LIMA',
+    'NAZCA': 'NASCA',
+}
+
+IndiceUnion = namedtuple('IndiceUnion', ['columnas', 'feature_de', 'sin_feature', 'sin_casos'])
+
+
+def normalizar_nombre(nombre):
+    # Sin tildes ni diéresis, en mayúsculas y solo con letras y números separados por un espacio.
+    texto = unicodedata.normalize('NFKD', str(nombre))
+    texto = ''.join(caracter for caracter in texto if not unicodedata.combining(caracter))
+    texto = re.sub(r'[^A-Z0-9]+', ' ', texto.upper()).strip()
+    return ALIAS.get(texto, texto)
+
+
+def construir_indice_union(propiedades, unidades):
+    # propiedades: las de cada feature, en orden; unidades: tabla con las columnas de la ruta
+    # del nivel (nombres tal como vienen en los casos). Devuelve ruta -> posición del feature.
+    columnas = list(unidades.columns)
+    profundidad = len(columnas)
+    rutas_features = []
+    por_nombre = {}
+    for i, propiedad in enumerate(propiedades):
+        # Un nivel superior ausente en el GeoJSON (None) no restringe la unión.
+        ruta = tuple(normalizar_nombre(propiedad[clave]) if propiedad.get(clave) is not None else None
+                     for clave in PROPIEDADES_RUTA[:profundidad])
+        rutas_features.append(ruta)
+        por_nombre.setdefault(ruta[-1], []).append(i)
+
+    feature_de = {}
+    sin_feature = []
+    for unidad in unidades.astype(str).itertuples(index=False, name=None):
+        ruta = tuple(normalizar_nombre(nombre) for nombre in unidad)
+        candidatos = [i for i in por_nombre.get(ruta[-1], [])
+                      if all(a is None or a == b for a, b in zip(rutas_features[i], ruta))]
+        if len(candidatos) == 1:
+            feature_de[unidad] = candidatos[0]
+        else:
+            sin_feature.append(unidad)
+
+    unidos = set(feature_de.values())
+    sin_casos = [rutas_features[i] for i in range(len(rutas_features)) if i not in unidos]
+    return IndiceUnion(columnas, feature_de, sin_feature, sin_casos)
+
+
+def indice_union(motor, columna, topologia, objeto='limites'):
+    # Una vez por nivel y por versión de los datos (se memoriza en el motor).
+    def construir():
+        geometrias = topologia['objects'][objeto]['geometries']
+        columnas = ruta_nivel(columna)
+        indice = construir_indice_union([geometria['properties'] for geometria in geometrias],
+                                        motor.jerarquia.unidades[columnas].drop_duplicates())
+        if indice.sin_feature:
+            log.warning(f'{len(indice.sin_feature)} unidades de nivel {columna} sin límite en el mapa: '
+                        f'{", ".join(" / ".join(unidad) for unidad in indice.sin_feature[:10])}')
+        return indice
+
+    return motor.agregado(('union_geo', columna, id(topologia)), construir)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from carga_datos import RUTA_CSV
+    from datos_compartidos import DatosCompartidos
+    from geometrias import cargar_topojson
+    from metricas import NIVELES
+
+    parser = argparse.ArgumentParser(description='Reporte de unidades de los casos sin límite geográfico y viceversa')
+    parser.add_argument('ruta', nargs='?', default=RUTA_CSV)
+    args = parser.parse_args()
+
+    motor = DatosCompartidos(args.ruta).obtener()
+    for nivel, columna in NIVELES.items():
+        indice = indice_union(motor, columna, cargar_topojson(nivel))
+        print(f'{nivel}: {len(indice.feature_de)} unidades unidas, {len(indice.sin_feature)} sin límite, '
+              f'{len(indice.sin_casos)} límites sin casos')
+        for unidad in indice.sin_feature:
+            print(f'  sin límite: {" / ".join(unidad)}')